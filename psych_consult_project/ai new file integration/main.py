@@ -1,13 +1,17 @@
 import os
+import sys
 import asyncio
 import logging
 from typing import Dict, List
 from datetime import datetime
-from openai import OpenAI
 
 from pdf_processor import PDFVectorStore
 from prompt import TherapyType, PromptManager, ConversationStyle
 
+# The LLM client is shared with the Django app; therapy.llm_client does not import Django.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from therapy.llm_client import ResilientLLMClient
+
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -21,9 +25,13 @@ class EmothriveAI:
         pdf_folder: str = './pdf/',
         default_therapy_type: TherapyType = TherapyType.GENERAL,
         model: str = "gpt-4.1-mini",
-        enable_crisis_detection: bool = True
+        enable_crisis_detection: bool = True,
+        llm_timeout: float = 20.0,
+        llm_max_retries: int = 2
     ):
-        self.client = OpenAI(api_key=openai_api_key)
+        self.llm = ResilientLLMClient(
+            api_key=openai_api_key, model=model, timeout=llm_timeout, max_retries=llm_max_retries
+        )
         
         self.pdf_store = PDFVectorStore(folder_path=pdf_folder)
         self.prompt_manager = PromptManager(
@@ -98,11 +106,7 @@ class EmothriveAI:
         )
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=300
-            )
+            response = await self.llm.acomplete(messages, max_tokens=300)
             response_text = response.choices[0].message.content
 
            
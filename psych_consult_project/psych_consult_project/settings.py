@@ -1,4 +1,5 @@
 # settings.py
+import json
 import os
 from pathlib import Path
 from datetime import timedelta
@@ -247,6 +248,11 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Dhaka'
+# Chat turns queued by ChatView in job mode; set THERAPY_CHAT_JOB_QUEUE=chat and run a separately scaled
+# worker pool with `celery -A psych_consult_project worker -Q chat` to keep them off the default queue.
+CELERY_TASK_ROUTES = {
+    'therapy.tasks.chat_turn_task': {'queue': os.environ.get('THERAPY_CHAT_JOB_QUEUE', 'celery')},
+}
 
 CELERY_BEAT_SCHEDULE = {
     'delete-old-therapy-sessions-daily': {
@@ -261,7 +267,78 @@ STRIPE_PUBLIC_KEY = os.environ.get('STRIPE_PUBLIC_KEY')
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
 STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")  # e.g. a local fake server for load tests
 GOOGLE_OAUTH2_CLIENT_ID = os.environ.get('GOOGLE_OAUTH2_CLIENT_ID')
 GOOGLE_OAUTH2_CLIENT_SECRET = os.environ.get('GOOGLE_OAUTH2_CLIENT_SECRET')
 
-PDF_FOLDER_PATH = BASE_DIR / "therapy" / "pdf"
\ No newline at end of file
+PDF_FOLDER_PATH = BASE_DIR / "therapy" / "pdf"
+VECTOR_STORE_PATH = BASE_DIR / "vector_store"
+# Load the embedder and FAISS index when the app starts instead of on the first chat request.
+THERAPY_WARM_KNOWLEDGE_BASE = os.environ.get('THERAPY_WARM_KNOWLEDGE_BASE', 'False') == 'True'
+# Token ceiling for a chat prompt and the share of it conversation history may use.
+THERAPY_MAX_PROMPT_TOKENS = int(os.environ.get('THERAPY_MAX_PROMPT_TOKENS', 6000))
+THERAPY_HISTORY_TOKEN_BUDGET = int(os.environ.get('THERAPY_HISTORY_TOKEN_BUDGET', 3000))
+# Shares of that ceiling for retrieved PDF context and the session summary (cut at sentence boundaries).
+THERAPY_CONTEXT_TOKEN_BUDGET = int(os.environ.get('THERAPY_CONTEXT_TOKEN_BUDGET', 1200))
+THERAPY_SUMMARY_TOKEN_BUDGET = int(os.environ.get('THERAPY_SUMMARY_TOKEN_BUDGET', 400))
+# Refresh TherapySession.summary once this many messages have arrived since the last summary, not counting
+# the newest KEEP_RECENT messages, which are never summarized so the prompt always has them verbatim.
+THERAPY_SUMMARY_EVERY_N_MESSAGES = int(os.environ.get('THERAPY_SUMMARY_EVERY_N_MESSAGES', 10))
+THERAPY_SUMMARY_KEEP_RECENT_MESSAGES = int(os.environ.get('THERAPY_SUMMARY_KEEP_RECENT_MESSAGES', 6))
+# Shared Redis tier of the query embedding / retrieval cache (empty disables it) and per-process LRU size.
+THERAPY_RETRIEVAL_CACHE_REDIS_URL = os.environ.get('THERAPY_RETRIEVAL_CACHE_REDIS_URL', 'redis://localhost:6379/1') or None
+THERAPY_RETRIEVAL_CACHE_SIZE = int(os.environ.get('THERAPY_RETRIEVAL_CACHE_SIZE', 1024))
+# Embedding backend from therapy.pdf_processor.EMBEDDING_BACKENDS: torch, torch-int8, onnx or onnx-int8.
+THERAPY_EMBEDDING_BACKEND = os.environ.get('THERAPY_EMBEDDING_BACKEND', 'torch')
+# Seconds between checks for a newly published knowledge base version in serving processes.
+THERAPY_INDEX_RELOAD_INTERVAL = int(os.environ.get('THERAPY_INDEX_RELOAD_INTERVAL', 60))
+# FAISS index_factory spec for the knowledge base ("Flat", "HNSW32", "IVF256,PQ48") and its
+# search-time parameters ("efSearch=64", "nprobe=16"). Compare options with `manage.py benchmark_index`.
+THERAPY_FAISS_INDEX_SPEC = os.environ.get('THERAPY_FAISS_INDEX_SPEC', 'Flat')
+THERAPY_FAISS_SEARCH_PARAMS = os.environ.get('THERAPY_FAISS_SEARCH_PARAMS', '')
+# Memory-map the published FAISS index read-only so all workers on a node share one copy.
+THERAPY_FAISS_MMAP = os.environ.get('THERAPY_FAISS_MMAP', 'False') == 'True'
+# "vector" (MiniLM similarity only) or "hybrid" (fused with BM25 so exact clinical terms are found),
+# and how many candidates each ranking contributes to the fusion. Compare with `manage.py benchmark_retrieval`.
+THERAPY_RETRIEVAL_MODE = os.environ.get('THERAPY_RETRIEVAL_MODE', 'vector')
+THERAPY_HYBRID_CANDIDATES = int(os.environ.get('THERAPY_HYBRID_CANDIDATES', 20))
+# Therapy type of knowledge base PDFs by filename glob, as JSON ({"*dbt*.pdf": "DBT"}); other PDFs are
+# classified from their text unless THERAPY_CLASSIFY_DOCUMENTS is off. Each type gets its own sub-index.
+THERAPY_DOCUMENT_TYPES = json.loads(os.environ.get('THERAPY_DOCUMENT_TYPES') or '{}')
+THERAPY_CLASSIFY_DOCUMENTS = os.environ.get('THERAPY_CLASSIFY_DOCUMENTS', 'True') == 'True'
+# Search the sub-index of the detected therapy type first, and how many of them a worker keeps loaded.
+THERAPY_PARTITIONED_RETRIEVAL = os.environ.get('THERAPY_PARTITIONED_RETRIEVAL', 'True') == 'True'
+THERAPY_MAX_RESIDENT_PARTITIONS = int(os.environ.get('THERAPY_MAX_RESIDENT_PARTITIONS', 4))
+# Re-rank retrieval candidates with a CPU cross-encoder: model, candidates over-fetched, chunks kept for the
+# prompt, and the retrieval time budget in ms beyond which re-ranking is skipped.
+THERAPY_RERANK_MODEL = os.environ.get('THERAPY_RERANK_MODEL', '')  # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+THERAPY_RERANK_CANDIDATES = int(os.environ.get('THERAPY_RERANK_CANDIDATES', 20))
+THERAPY_RERANK_KEEP = int(os.environ.get('THERAPY_RERANK_KEEP', 2))
+THERAPY_RERANK_BUDGET_MS = int(os.environ.get('THERAPY_RERANK_BUDGET_MS', 150))
+# Drop chunks whose estimated Jaccard similarity to an indexed chunk reaches this value at ingest (0 disables).
+THERAPY_DEDUP_THRESHOLD = float(os.environ.get('THERAPY_DEDUP_THRESHOLD', 0.9))
+# Maximal marginal relevance over THERAPY_MMR_CANDIDATES chunks when not re-ranking: 1.0 is pure relevance,
+# lower values favour chunks that say something different (empty or 0 disables).
+THERAPY_MMR_LAMBDA = float(os.environ.get('THERAPY_MMR_LAMBDA', 0.7) or 0) or None
+THERAPY_MMR_CANDIDATES = int(os.environ.get('THERAPY_MMR_CANDIDATES', 10))
+# Canned replies for small talk (ChatIntent, editable in the admin): cosine similarity a message needs to reach
+# an intent's examples, and the longest message in words that is considered.
+THERAPY_INTENT_ROUTER = os.environ.get('THERAPY_INTENT_ROUTER', 'True') == 'True'
+THERAPY_INTENT_THRESHOLD = float(os.environ.get('THERAPY_INTENT_THRESHOLD', 0.85))
+THERAPY_INTENT_MAX_WORDS = int(os.environ.get('THERAPY_INTENT_MAX_WORDS', 12))
+# Chat completions: model, deadline in seconds for a whole call including retries, and retries of transient
+# failures (timeouts, 429, 5xx) with jittered exponential backoff.
+THERAPY_LLM_MODEL = os.environ.get('THERAPY_LLM_MODEL', 'gpt-4.1-mini')
+THERAPY_LLM_TIMEOUT = float(os.environ.get('THERAPY_LLM_TIMEOUT', 20))
+THERAPY_LLM_MAX_RETRIES = int(os.environ.get('THERAPY_LLM_MAX_RETRIES', 2))
+# Send a second request when a completion is slower than the recent p95 (but at least the minimum delay);
+# cuts tail latency at the cost of paying for duplicate completions.
+THERAPY_LLM_HEDGE = os.environ.get('THERAPY_LLM_HEDGE', 'False') == 'True'
+THERAPY_LLM_HEDGE_MIN_DELAY_MS = int(os.environ.get('THERAPY_LLM_HEDGE_MIN_DELAY_MS', 1000))
+# Fail fast for RESET_SECONDS once this share of at least MIN_CALLS calls in the last WINDOW_SECONDS failed.
+THERAPY_LLM_BREAKER_ERROR_RATE = float(os.environ.get('THERAPY_LLM_BREAKER_ERROR_RATE', 0.5))
+THERAPY_LLM_BREAKER_MIN_CALLS = int(os.environ.get('THERAPY_LLM_BREAKER_MIN_CALLS', 10))
+THERAPY_LLM_BREAKER_WINDOW_SECONDS = float(os.environ.get('THERAPY_LLM_BREAKER_WINDOW_SECONDS', 30))
+THERAPY_LLM_BREAKER_RESET_SECONDS = float(os.environ.get('THERAPY_LLM_BREAKER_RESET_SECONDS', 30))
+# Threads per process that run knowledge base retrieval of sync chat turns while the history is read.
+THERAPY_RETRIEVAL_THREADS = int(os.environ.get('THERAPY_RETRIEVAL_THREADS', 8))
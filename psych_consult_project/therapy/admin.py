@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import ChatIntent
 
-# Register your models here.
+@admin.register(ChatIntent)
+class ChatIntentAdmin(admin.ModelAdmin):
+    list_display = ('name', 'is_active', 'threshold', 'updated_at')
+    list_filter = ('is_active',)
+    search_fields = ('name', 'examples', 'reply')
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class TherapyConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'therapy'
+
+    def ready(self):
+        # Optionally pay the embedder/FAISS load cost at worker start-up
+        # rather than inside the first chat request.
+        if getattr(settings, 'THERAPY_WARM_KNOWLEDGE_BASE', False):
+            from .knowledge_base import get_knowledge_base
+            get_knowledge_base()
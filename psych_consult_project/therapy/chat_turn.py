@@ -0,0 +1,125 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from .history import load_recent_history, schedule_summary_if_due
+from .models import TherapyChatMessage
+from .prompt import ConversationStyle, PromptManager, TherapyType
+
+logger = logging.getLogger(__name__)
+
+# Retrieval of sync chat turns runs here while the request thread reads the history; FAISS and
+# the embedder release the GIL. ORM queries stay on the request thread and its DB connection.
+_retrieval_pool = ThreadPoolExecutor(max_workers=settings.THERAPY_RETRIEVAL_THREADS, thread_name_prefix="retrieval")
+
+
+class TurnTimings:
+    """Wall-clock milliseconds spent in each stage of a chat turn."""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (time.perf_counter() - started) * 1000
+
+    def timed(self, name: str, fn, *args, **kwargs):
+        with self.stage(name):
+            return fn(*args, **kwargs)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(ms, 1) for name, ms in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """Value of a Server-Timing response header, so the stages show up in browser dev tools."""
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self.stages.items())
+
+
+def chat_prompt_manager() -> PromptManager:
+    """PromptManager configured with the prompt and token budgets of the chat endpoints."""
+    return PromptManager(
+        default_therapy_type=TherapyType.GENERAL,
+        conversation_style=ConversationStyle.EMPATHETIC,
+        max_prompt_tokens=settings.THERAPY_MAX_PROMPT_TOKENS,
+        history_token_budget=settings.THERAPY_HISTORY_TOKEN_BUDGET,
+        context_token_budget=settings.THERAPY_CONTEXT_TOKEN_BUDGET,
+        summary_token_budget=settings.THERAPY_SUMMARY_TOKEN_BUDGET
+    )
+
+
+def retrieval_therapy_type(prompt_manager, user_message):
+    """Therapy type whose knowledge base partition retrieval should search first, if partitioning is on."""
+    if not settings.THERAPY_PARTITIONED_RETRIEVAL:
+        return None
+    return prompt_manager.detect_therapy_type(user_message)
+
+
+def build_chat_messages(prompt_manager, pdf_store, session, user_message,
+                        timings: Optional[TurnTimings] = None) -> List[Dict]:
+    """
+    Assemble the prompt of a chat turn. Retrieval of PDF context and the
+    history read do not depend on each other, so retrieval runs on a pool
+    thread meanwhile and the turn waits only for the slower of the two.
+    """
+    timings = timings if timings is not None else TurnTimings()
+    with timings.stage("pre_llm"):
+        retrieval = None
+        if pdf_store and pdf_store.vector_store:
+            therapy_type = retrieval_therapy_type(prompt_manager, user_message)
+            retrieval = _retrieval_pool.submit(
+                timings.timed, "retrieval", pdf_store.retrieve_pdf_context, user_message, therapy_type=therapy_type
+            )
+
+        # History is paged newest-first and only read as far as the token window reaches
+        with timings.stage("history"):
+            recent_history = load_recent_history(
+                session, prompt_manager.history_token_budget, prompt_manager.count_message_tokens
+            )
+        pdf_context = ""
+        if retrieval:
+            try:
+                pdf_context = retrieval.result()
+            except Exception as e:
+                # The turn is answered without PDF context rather than dropped.
+                logger.error(f"Error retrieving PDF context: {e}", exc_info=True)
+
+        with timings.stage("prompt"):
+            messages, usage = prompt_manager.assemble_conversation(
+                user_input=user_message,
+                pdf_context=pdf_context,
+                recent_history=recent_history,
+                session_summary=session.summary
+            )
+    logger.info(f"Prompt tokens for session {session.id}: {usage.as_dict()}")
+    return messages
+
+
+def save_chat_turn(session, user_message, ai_response_text):
+    # Save message to database, linked to the session
+    TherapyChatMessage.objects.create(
+        session=session,
+        user_message=user_message,
+        ai_response=ai_response_text
+    )
+
+    # If this is the first message in a new session, set the title
+    if not session.title:
+        # Use the first 50 characters of the user's message as the title
+        session.title = user_message[:50] + ('...' if len(user_message) > 50 else '')
+
+    # Update session's updated_at timestamp. Limit the write to these fields so a
+    # summary stored by the background task in the meantime is not overwritten.
+    session.save(update_fields=['title', 'updated_at'])
+
+    try:
+        schedule_summary_if_due(session)
+    except Exception as e:
+        logger.error(f"Error scheduling session summary: {e}")
@@ -0,0 +1,164 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from langchain.schema import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+# Chunk texts and metadata of a published index, keyed by FAISS row position and chunk id.
+CHUNKS_FILE = "chunks.sqlite3"
+
+# Bytes of the database file SQLite may memory-map instead of copying pages into its cache.
+MMAP_SIZE = 1 << 30
+
+# Words too common to be useful lexical evidence; they would only make BM25 scan more postings.
+BM25_STOPWORDS = frozenset("""
+a about am an and are as at be been but by can could did do does for from had has have how i i'm if in
+into is it its me my myself no not of on or our so than that the their them then there they this to
+too very was we were what when where which who why will with would you your
+""".split())
+BM25_MAX_TERMS = 32
+_WORD_RE = re.compile(r"[\w'-]+", re.UNICODE)
+
+
+def bm25_match_query(text: str) -> str:
+    """Turn free text into an FTS5 OR-query of quoted terms, dropping stopwords."""
+    terms = []
+    for word in _WORD_RE.findall(text.lower()):
+        word = word.strip("'-")
+        if word and word not in BM25_STOPWORDS and word not in terms:
+            terms.append(word)
+    return " OR ".join(f'"{term}"' for term in terms[:BM25_MAX_TERMS])
+
+
+def write_chunk_store(db_path: str, docstore: Docstore, index_to_docstore_id: Mapping):
+    """Write every indexed chunk to a fresh SQLite file and move it into place."""
+    tmp_path = f"{db_path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute(
+            "CREATE TABLE chunks ("
+            "position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        rows = (
+            (position, chunk_id, doc.page_content, json.dumps(doc.metadata))
+            for position, chunk_id in sorted(index_to_docstore_id.items())
+            for doc in [docstore.search(chunk_id)]
+        )
+        connection.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+        # BM25 inverted index over the same chunks (external-content FTS5 table, rowid = FAISS position).
+        connection.execute(
+            "CREATE VIRTUAL TABLE chunks_fts USING fts5("
+            "content, content='chunks', content_rowid='position', tokenize='porter unicode61')"
+        )
+        connection.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+        connection.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('optimize')")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, db_path)
+
+
+class SQLiteChunkStore(Docstore):
+    """
+    Read-only LangChain docstore over chunks.sqlite3. Chunk texts are read
+    lazily by id, so loading an index no longer deserializes the whole
+    corpus into Python objects. Files of published versions never change,
+    which lets SQLite open them immutable and memory-mapped.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.db_path}?mode=ro&immutable=1", uri=True)
+            connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+            self._local.connection = connection
+        return connection
+
+    def search(self, search: str) -> Union[str, Document]:
+        row = self._connection().execute("SELECT content, metadata FROM chunks WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def id_at(self, position: int) -> Union[str, None]:
+        row = self._connection().execute("SELECT id FROM chunks WHERE position = ?", (position,)).fetchone()
+        return row[0] if row else None
+
+    def positions_of(self, chunk_ids: List[str]) -> List[int]:
+        """FAISS row positions of chunk_ids, in the same order."""
+        placeholders = ", ".join("?" * len(chunk_ids))
+        rows = self._connection().execute(
+            f"SELECT id, position FROM chunks WHERE id IN ({placeholders})", chunk_ids
+        ).fetchall()
+        positions = dict(rows)
+        return [positions[chunk_id] for chunk_id in chunk_ids]
+
+    def iter_chunks(self) -> Iterator[Tuple[int, str, Document]]:
+        cursor = self._connection().execute("SELECT position, id, content, metadata FROM chunks ORDER BY position")
+        for position, chunk_id, content, metadata in cursor:
+            yield position, chunk_id, Document(page_content=content, metadata=json.loads(metadata))
+
+    def search_bm25(self, query: str, limit: int, therapy_type: Optional[str] = None) -> List[str]:
+        """
+        Chunk ids ranked by BM25 for query, optionally only chunks tagged with
+        therapy_type; empty for stores written without the FTS index.
+        """
+        match = bm25_match_query(query)
+        if not match:
+            return []
+        sql = ("SELECT chunks.id FROM chunks_fts JOIN chunks ON chunks.position = chunks_fts.rowid "
+               "WHERE chunks_fts MATCH ?")
+        params = [match]
+        if therapy_type:
+            sql += " AND json_extract(chunks.metadata, '$.therapy_type') = ?"
+            params.append(therapy_type)
+        try:
+            rows = self._connection().execute(
+                f"{sql} ORDER BY bm25(chunks_fts) LIMIT ?", (*params, limit)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return []
+        return [row[0] for row in rows]
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def load_in_memory(self) -> Tuple[InMemoryDocstore, Dict[int, str]]:
+        """Writable copy for builders, which add and delete vectors."""
+        documents = {}
+        index_to_docstore_id = {}
+        for position, chunk_id, doc in self.iter_chunks():
+            documents[chunk_id] = doc
+            index_to_docstore_id[position] = chunk_id
+        return InMemoryDocstore(documents), index_to_docstore_id
+
+
+class SQLiteIndexMapping(Mapping):
+    """FAISS row position -> chunk id, looked up on demand instead of held as a dict."""
+
+    def __init__(self, chunk_store: SQLiteChunkStore):
+        self.chunk_store = chunk_store
+
+    def __getitem__(self, position: int) -> str:
+        chunk_id = self.chunk_store.id_at(int(position))
+        if chunk_id is None:
+            raise KeyError(position)
+        return chunk_id
+
+    def __iter__(self) -> Iterator[int]:
+        return (position for position, _, _ in self.chunk_store.iter_chunks())
+
+    def __len__(self) -> int:
+        return self.chunk_store.count()
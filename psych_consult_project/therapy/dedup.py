@@ -0,0 +1,97 @@
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+# Prime modulus of the MinHash permutations; small enough that a * x + b fits in uint64.
+_PRIME = (1 << 31) - 1
+
+
+class MinHashDeduplicator:
+    """
+    Near-duplicate detection for chunks at ingest time. Each chunk is
+    reduced to a MinHash signature over its word shingles; locality
+    sensitive hashing on bands of the signature finds candidates without
+    comparing against every indexed chunk, and a candidate counts as a
+    duplicate when the estimated Jaccard similarity reaches `threshold`.
+    Exact copies of a passage that appear in several PDFs (a handout that
+    is also a chapter, two editions of a manual) are indexed only once.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = 64, bands: int = 16, shingle_size: int = 5,
+                 seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._buckets: List[Dict[bytes, Set[str]]] = [defaultdict(set) for _ in range(bands)]
+
+    def signature(self, text: str) -> np.ndarray:
+        words = text.lower().split()
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) % _PRIME for s in shingles), dtype=np.uint64,
+                             count=len(shingles))
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[bytes]:
+        for band in range(self.bands):
+            yield signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def find_duplicate(self, signature: np.ndarray) -> Optional[str]:
+        """Id of an indexed chunk that is a near-duplicate of signature, if any."""
+        checked = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            for other_id in self._buckets[band].get(key, ()):
+                if other_id in checked:
+                    continue
+                checked.add(other_id)
+                if np.mean(self._signatures[other_id] == signature) >= self.threshold:
+                    return other_id
+        return None
+
+    def add(self, chunk_id: str, signature: np.ndarray):
+        self._signatures[chunk_id] = signature
+        for band, key in enumerate(self._band_keys(signature)):
+            self._buckets[band][key].add(chunk_id)
+
+    def check_and_add(self, chunk_id: str, text: str) -> Optional[str]:
+        """
+        Register a chunk and return None, or return the id of the chunk it
+        duplicates without registering it. A chunk id that is already known
+        is the same chunk seen again (e.g. a resumed build), not a duplicate.
+        """
+        if chunk_id in self._signatures:
+            return None
+        signature = self.signature(text)
+        duplicate_of = self.find_duplicate(signature)
+        if duplicate_of is None:
+            self.add(chunk_id, signature)
+        return duplicate_of
+
+    def remove(self, chunk_ids: Iterable[str]):
+        for chunk_id in chunk_ids:
+            signature = self._signatures.pop(chunk_id, None)
+            if signature is None:
+                continue
+            for band, key in enumerate(self._band_keys(signature)):
+                bucket = self._buckets[band].get(key)
+                if bucket is not None:
+                    bucket.discard(chunk_id)
+                    if not bucket:
+                        del self._buckets[band][key]
+
+    def clear(self):
+        self._signatures.clear()
+        for buckets in self._buckets:
+            buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._signatures)
@@ -0,0 +1,86 @@
+from typing import Callable, Dict, Iterator, List
+from django.conf import settings
+from .models import TherapyChatMessage
+from .tasks import summarize_therapy_session_task
+
+# Rows fetched per round trip while walking a session's history backwards.
+HISTORY_PAGE_SIZE = 10
+
+
+def _message_pair(chat_message: TherapyChatMessage) -> List[Dict]:
+    # Newest-first order, so the assistant reply precedes the user message it answered.
+    return [
+        {"role": "assistant", "content": chat_message.ai_response},
+        {"role": "user", "content": chat_message.user_message},
+    ]
+
+
+def _unsummarized_messages(session):
+    # Messages already folded into session.summary are represented by the summary instead.
+    return TherapyChatMessage.objects.filter(session=session, id__gt=session.summary_last_message_id or 0)
+
+
+def _history_page(session, offset: int):
+    return _unsummarized_messages(session).order_by('-timestamp', '-id')[offset:offset + HISTORY_PAGE_SIZE]
+
+
+def iter_recent_history(session) -> Iterator[Dict]:
+    """
+    Yield a session's not yet summarized chat messages newest-first, one small page at a time,
+    so a consumer that stops early (PromptManager.window_history) never reads
+    rows beyond the token window.
+    """
+    offset = 0
+    while True:
+        page = list(_history_page(session, offset))
+        for chat_message in page:
+            yield from _message_pair(chat_message)
+        if len(page) < HISTORY_PAGE_SIZE:
+            return
+        offset += HISTORY_PAGE_SIZE
+
+
+def load_recent_history(session, token_budget: int, count_message_tokens: Callable[[Dict], int]) -> List[Dict]:
+    """
+    Read newest-first messages from iter_recent_history until token_budget
+    is covered, so the read can finish before the prompt is assembled (and
+    run alongside retrieval) while still stopping at the token window.
+    """
+    messages = []
+    used = 0
+    for message in iter_recent_history(session):
+        messages.append(message)
+        used += count_message_tokens(message)
+        if used >= token_budget:
+            break
+    return messages
+
+
+async def aload_recent_history(session, token_budget: int, count_message_tokens: Callable[[Dict], int]) -> List[Dict]:
+    """
+    Async counterpart of iter_recent_history: fetch pages newest-first until
+    token_budget is covered and return the messages newest-first.
+    """
+    messages = []
+    used = 0
+    offset = 0
+    while used < token_budget:
+        page = [chat_message async for chat_message in _history_page(session, offset)]
+        for chat_message in page:
+            for message in _message_pair(chat_message):
+                messages.append(message)
+                used += count_message_tokens(message)
+        if len(page) < HISTORY_PAGE_SIZE:
+            break
+        offset += HISTORY_PAGE_SIZE
+    return messages
+
+
+def schedule_summary_if_due(session):
+    """
+    Queue a summary refresh once THERAPY_SUMMARY_EVERY_N_MESSAGES messages
+    have accumulated behind the THERAPY_SUMMARY_KEEP_RECENT_MESSAGES raw tail.
+    """
+    due = settings.THERAPY_SUMMARY_EVERY_N_MESSAGES + settings.THERAPY_SUMMARY_KEEP_RECENT_MESSAGES
+    if _unsummarized_messages(session).count() >= due:
+        summarize_therapy_session_task.delay(str(session.id))
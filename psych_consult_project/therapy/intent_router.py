@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from django.db.models import Count, Max
+
+from .models import ChatIntent
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IntentMatch:
+    name: str
+    reply: str
+    score: float
+
+
+class IntentRouter:
+    """
+    Fast path in front of retrieval and the LLM: the message is embedded
+    once and compared with the embedded examples of every active
+    ChatIntent, held in memory as one normalized matrix. A match above the
+    intent's threshold is answered with its canned reply. The message
+    embedding goes through PDFVectorStore.embed_query, whose cache hands
+    the same vector to retrieval when the message falls through.
+    """
+
+    def __init__(self, embed_query: Callable[[str], List[float]],
+                 embed_documents: Callable[[List[str]], List[List[float]]],
+                 threshold: float = 0.85, max_words: int = 12, reload_interval: float = 60.0):
+        self.embed_query = embed_query
+        self.embed_documents = embed_documents
+        self.threshold = threshold
+        # Longer messages are never small talk; skipping them avoids false positives.
+        self.max_words = max_words
+        self.reload_interval = reload_interval
+        # (normalized example embeddings, intent of each row), swapped as one reference on reload.
+        self._table: Tuple[Optional[np.ndarray], List[ChatIntent]] = (None, [])
+        self._table_version = None
+        self._last_check = float("-inf")
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    def refresh_if_stale(self):
+        """Re-embed the intent table when it was edited, checking at most every reload_interval seconds."""
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._last_check = now
+            version = ChatIntent.objects.filter(is_active=True).aggregate(count=Count('id'), updated=Max('updated_at'))
+            if version != self._table_version:
+                self._load()
+                self._table_version = version
+        except Exception as e:
+            logger.error(f"Error loading chat intents: {e}")
+        finally:
+            self._lock.release()
+
+    def _load(self):
+        owners, examples = [], []
+        for intent in ChatIntent.objects.filter(is_active=True):
+            for example in intent.example_list():
+                owners.append(intent)
+                examples.append(example)
+        matrix = None
+        if examples:
+            matrix = np.array(self.embed_documents(examples), dtype=np.float32)
+            matrix /= np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12
+        self._table = (matrix, owners)
+        logger.info(f"Loaded {len(examples)} examples of {len(set(owners))} chat intents")
+
+    def match(self, message: str) -> Optional[IntentMatch]:
+        """Best intent for message above its threshold; does not touch the database."""
+        matrix, owners = self._table
+        if matrix is None or len(message.split()) > self.max_words:
+            return None
+        vector = np.array(self.embed_query(message), dtype=np.float32)
+        scores = matrix @ (vector / (np.linalg.norm(vector) + 1e-12))
+        best = int(np.argmax(scores))
+        intent, score = owners[best], float(scores[best])
+        threshold = intent.threshold if intent.threshold is not None else self.threshold
+        if score < threshold:
+            self.counters["fallthrough"] += 1
+            return None
+        self.counters[f"matched:{intent.name}"] += 1
+        return IntentMatch(name=intent.name, reply=intent.reply, score=score)
+
+    def route(self, message: str) -> Optional[IntentMatch]:
+        self.refresh_if_stale()
+        return self.match(message)
+
+    def get_stats(self) -> Dict:
+        return {
+            "examples": len(self._table[1]),
+            "threshold": self.threshold,
+            **self.counters,
+        }
@@ -0,0 +1,234 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from langchain_community.vectorstores import FAISS
+
+from .pdf_processor import PDFVectorStore, chunk_id_prefix, file_sha256
+
+logger = logging.getLogger(__name__)
+
+BUILD_DIR = "building"
+CHECKPOINT_FILE = "checkpoint.json"
+LOCK_FILE = "build.lock"
+
+
+class BuildInProgress(Exception):
+    pass
+
+
+class KnowledgeBaseBuilder:
+    """
+    Builds the FAISS knowledge base outside the request path. Progress is
+    checkpointed into <vector_store_path>/building/ after every PDF and every
+    `checkpoint_every` embedding batches, so a crashed build resumes where it
+    stopped. The finished index is published through
+    PDFVectorStore.publish_vector_store(), which swaps it in atomically.
+    """
+
+    def __init__(self, pdf_store: PDFVectorStore, checkpoint_every: int = 20,
+                 report: Callable[[str], None] = logger.info):
+        self.pdf_store = pdf_store
+        self.checkpoint_every = checkpoint_every
+        self.report = report
+        self.staging_path = os.path.join(pdf_store.vector_store_path, BUILD_DIR)
+        self.vector_store: Optional[FAISS] = None
+        self.state: Dict = {}
+        self.stats = {"files": 0, "pages": 0, "chunks": 0}
+        self._batches_since_checkpoint = 0
+        self._started = 0.0
+
+    @contextmanager
+    def _build_lock(self):
+        with open(os.path.join(self.pdf_store.vector_store_path, LOCK_FILE), 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise BuildInProgress("Another knowledge base build is already running.")
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def build(self, resume: bool = True, full: bool = False) -> Dict:
+        with self._build_lock():
+            self._started = time.perf_counter()
+            if not (resume and self._restore_checkpoint()):
+                self._start_fresh(full)
+
+            current = {f: file_sha256(os.path.join(self.pdf_store.folder_path, f)) for f in self.pdf_store.list_pdf_files()}
+            stale_ids = self._collect_stale(current)
+            if stale_ids and self.vector_store and not self.pdf_store.supports_deletion:
+                self.report(f"{self.pdf_store.index_spec} index cannot delete vectors; rebuilding from scratch.")
+                self._start_fresh(full=True)
+                stale_ids = []
+            if stale_ids and self.vector_store:
+                self.vector_store.delete(stale_ids)
+            dirty = bool(stale_ids) or bool(self.state.get("dirty"))
+            pending = [f for f in current if self.state["files"].get(f, {}).get("sha256") != current[f]]
+
+            if not pending and not dirty:
+                self.report("Knowledge base is up to date.")
+                shutil.rmtree(self.staging_path, ignore_errors=True)
+                return self._summary()
+
+            # Seeding hashes every indexed chunk, so it waits until there is something to ingest.
+            self.pdf_store.reset_deduplicator(self.vector_store)
+            self.state["dirty"] = True
+            for pdf_doc in self.pdf_store.iter_pdf_documents(pending):
+                self.state["in_progress"] = {"filename": pdf_doc.filename, "sha256": pdf_doc.file_hash}
+                docs, ids, duplicate_of = self.pdf_store._chunk_document(pdf_doc)
+                present = set(self.vector_store.index_to_docstore_id.values()) if self.vector_store else set()
+                todo = [(doc, chunk_id) for doc, chunk_id in zip(docs, ids) if chunk_id not in present]
+                # Keep short training buffers pending across PDFs so IVF/PQ trains on a corpus-wide sample.
+                self.vector_store = self.pdf_store._embed_into_index(todo, self.vector_store, on_batch=self._on_batch, flush=False)
+
+                self.state["files"][pdf_doc.filename] = self.pdf_store._manifest_entry(pdf_doc, ids, duplicate_of)
+                self.state["in_progress"] = None
+                self.stats["files"] += 1
+                self.stats["pages"] += pdf_doc.page_count
+                self._checkpoint()
+                self.report(f"Indexed {pdf_doc.filename}: {pdf_doc.page_count} pages, {len(todo)} new chunks. {self._throughput()}")
+
+            if self.pdf_store._train_buffer:
+                self.pdf_store._train_and_flush(self.vector_store, self._on_batch)
+            if self.vector_store is None:
+                raise ValueError("No documents loaded. Please add PDF files to the folder.")
+            self._publish()
+            return self._summary()
+
+    def _start_fresh(self, full: bool):
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+        self.vector_store = None
+        self.state = {
+            "embedding_model": self.pdf_store.embedding_model_name,
+            "embedding_backend": self.pdf_store.embedding_backend,
+            "index_spec": self.pdf_store.index_spec,
+            "files": {},
+            "in_progress": None,
+            "index_dir": None,
+        }
+        if full:
+            return
+        # Start from the published index so only new or changed PDFs are embedded.
+        manifest = self.pdf_store._read_manifest(self.pdf_store.current_index_path())
+        if manifest.get("embedding_model") == self.pdf_store.embedding_model_name and \
+                manifest.get("index_spec", "Flat") == self.pdf_store.index_spec and \
+                self.pdf_store.load_vector_store():
+            self.vector_store = self.pdf_store.vector_store
+            self.state["files"] = dict(manifest.get("files", {}))
+
+    def _restore_checkpoint(self) -> bool:
+        try:
+            with open(os.path.join(self.staging_path, CHECKPOINT_FILE)) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("embedding_model") != self.pdf_store.embedding_model_name or \
+                state.get("embedding_backend") != self.pdf_store.embedding_backend or \
+                state.get("index_spec", "Flat") != self.pdf_store.index_spec:
+            return False
+        if state.get("index_dir"):
+            self.vector_store = self.pdf_store.read_vector_store(os.path.join(self.staging_path, state["index_dir"]))
+        self.state = state
+        self.report(f"Resuming knowledge base build: {len(state['files'])} PDFs already indexed.")
+        return True
+
+    def _collect_stale(self, current: Dict[str, str]) -> List[str]:
+        """
+        Chunk ids of PDFs that were removed or changed since they were indexed,
+        and of the PDFs that depended on them for deduplicated passages. All of
+        them leave the manifest, so the build re-ingests whatever still exists.
+        """
+        stale_ids: List[str] = []
+        for filename, entry in list(self.state["files"].items()):
+            if current.get(filename) != entry["sha256"]:
+                stale_ids.extend(entry["chunk_ids"])
+                del self.state["files"][filename]
+
+        # PDFs whose near-duplicate chunks were dropped in favour of stale ones are re-ingested, so those
+        # passages come back; their own chunks may in turn have been kept over other PDFs' chunks.
+        stale = set(stale_ids)
+        while True:
+            dependents = [filename for filename, entry in self.state["files"].items()
+                          if stale.intersection(entry.get("duplicate_of", ()))]
+            if not dependents:
+                break
+            for filename in dependents:
+                entry = self.state["files"].pop(filename)
+                stale_ids.extend(entry["chunk_ids"])
+                stale.update(entry["chunk_ids"])
+            self.report(f"Re-ingesting {', '.join(dependents)}: chunks they duplicated are being removed.")
+
+        # Chunks of a PDF that was half-indexed when the previous run stopped and has changed since.
+        in_progress = self.state.get("in_progress")
+        if in_progress and self.vector_store and current.get(in_progress["filename"]) != in_progress["sha256"]:
+            prefix = chunk_id_prefix(in_progress["filename"], in_progress["sha256"])
+            stale_ids.extend(i for i in self.vector_store.index_to_docstore_id.values() if i.startswith(prefix))
+            self.state["in_progress"] = None
+        return stale_ids
+
+    def _on_batch(self, vector_store: FAISS, ids: List[str]):
+        self.vector_store = vector_store
+        self.stats["chunks"] += len(ids)
+        self._batches_since_checkpoint += 1
+        if self._batches_since_checkpoint >= self.checkpoint_every:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        """
+        Save the partial index into a new directory, then atomically point
+        checkpoint.json at it, so a crash mid-save never leaves a torn state.
+        """
+        self._batches_since_checkpoint = 0
+        # Nothing durable to save while an IVF/PQ index is still collecting its training sample.
+        if self.vector_store is None or self.pdf_store._train_buffer:
+            return
+        os.makedirs(self.staging_path, exist_ok=True)
+        previous_dir = self.state.get("index_dir")
+        index_dir = f"index-{uuid.uuid4().hex[:8]}"
+        self.pdf_store.write_vector_store(self.vector_store, os.path.join(self.staging_path, index_dir))
+        self.state["index_dir"] = index_dir
+
+        checkpoint_tmp = os.path.join(self.staging_path, f"{CHECKPOINT_FILE}.tmp")
+        with open(checkpoint_tmp, 'w') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(checkpoint_tmp, os.path.join(self.staging_path, CHECKPOINT_FILE))
+        if previous_dir:
+            shutil.rmtree(os.path.join(self.staging_path, previous_dir), ignore_errors=True)
+
+    def _publish(self):
+        self.pdf_store.vector_store = self.vector_store
+        self.pdf_store.manifest = {
+            "embedding_model": self.pdf_store.embedding_model_name,
+            "embedding_backend": self.pdf_store.embedding_backend,
+            "index_spec": self.pdf_store.index_spec,
+            "files": self.state["files"],
+        }
+        self.pdf_store.index_version = uuid.uuid4().hex
+        self.pdf_store.publish_vector_store()
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+        self.report(f"Published knowledge base version {self.pdf_store.index_version}. {self._throughput()}")
+
+    def _throughput(self) -> str:
+        elapsed = max(time.perf_counter() - self._started, 1e-9)
+        return (f"{self.stats['pages'] / elapsed:.1f} pages/s, {self.stats['chunks'] / elapsed:.1f} chunks/s "
+                f"over {elapsed:.1f}s")
+
+    def _summary(self) -> Dict:
+        elapsed = time.perf_counter() - self._started
+        return {
+            **self.stats,
+            "seconds": elapsed,
+            "pages_per_second": self.stats["pages"] / elapsed if elapsed else 0.0,
+            "chunks_per_second": self.stats["chunks"] / elapsed if elapsed else 0.0,
+            "index_version": self.pdf_store.index_version,
+        }
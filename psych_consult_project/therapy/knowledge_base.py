@@ -0,0 +1,243 @@
+import logging
+import os
+import resource
+import threading
+import time
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from .intent_router import IntentRouter
+from .llm_client import CircuitBreaker, ResilientLLMClient
+from .pdf_processor import PDFVectorStore
+from .reranker import CrossEncoderReranker
+from .retrieval_cache import RetrievalCache
+from .tasks import build_knowledge_base_task
+
+logger = logging.getLogger(__name__)
+
+
+def _current_rss_mb() -> float:
+    """Resident set size of this process in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def process_memory_mb() -> Dict[str, float]:
+    """
+    RSS split into private and shared pages, plus PSS (shared pages divided
+    among the processes mapping them), from /proc/self/smaps_rollup. PSS is
+    the number that drops when workers share a memory-mapped index.
+    """
+    fields = {"Rss": "rss_mb", "Pss": "pss_mb", "Shared_Clean": "shared_mb", "Shared_Dirty": "shared_mb",
+              "Private_Clean": "private_mb", "Private_Dirty": "private_mb"}
+    memory = {"rss_mb": 0.0, "pss_mb": 0.0, "shared_mb": 0.0, "private_mb": 0.0}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in fields:
+                    memory[fields[name]] += int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        memory["rss_mb"] = _current_rss_mb()
+    return memory
+
+
+def build_llm_client() -> ResilientLLMClient:
+    """ResilientLLMClient configured from the THERAPY_LLM_* settings."""
+    return ResilientLLMClient(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL,
+        model=settings.THERAPY_LLM_MODEL,
+        timeout=settings.THERAPY_LLM_TIMEOUT,
+        max_retries=settings.THERAPY_LLM_MAX_RETRIES,
+        hedge=settings.THERAPY_LLM_HEDGE,
+        hedge_min_delay=settings.THERAPY_LLM_HEDGE_MIN_DELAY_MS / 1000,
+        breaker=CircuitBreaker(
+            error_rate=settings.THERAPY_LLM_BREAKER_ERROR_RATE,
+            min_calls=settings.THERAPY_LLM_BREAKER_MIN_CALLS,
+            window_seconds=settings.THERAPY_LLM_BREAKER_WINDOW_SECONDS,
+            reset_seconds=settings.THERAPY_LLM_BREAKER_RESET_SECONDS
+        )
+    )
+
+
+class KnowledgeBase:
+    """
+    Owns the expensive, request-independent chat dependencies: the LLM
+    client (sync and async, with its circuit breaker), the embedding model
+    and the FAISS index. One
+    instance is shared by every request in a worker process, see
+    get_knowledge_base().
+    """
+
+    def __init__(self):
+        self.llm: Optional[ResilientLLMClient] = None
+        self.pdf_store: Optional[PDFVectorStore] = None
+        self.retrieval_cache: Optional[RetrievalCache] = None
+        self.reranker: Optional[CrossEncoderReranker] = None
+        self.intent_router: Optional[IntentRouter] = None
+        self.load_seconds: Optional[float] = None
+        self.rss_before_mb: Optional[float] = None
+        self.rss_after_mb: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self._last_version_check = 0.0
+        self._reload_lock = threading.Lock()
+
+    def load(self):
+        self.rss_before_mb = _current_rss_mb()
+        started = time.perf_counter()
+
+        self.llm = get_llm_client()
+        embedding_model_name = "sentence-transformers/all-MiniLM-L6-v2"
+        self.retrieval_cache = RetrievalCache(
+            namespace=f"therapy:retrieval:{embedding_model_name}:{settings.THERAPY_EMBEDDING_BACKEND}",
+            redis_url=settings.THERAPY_RETRIEVAL_CACHE_REDIS_URL,
+            local_size=settings.THERAPY_RETRIEVAL_CACHE_SIZE
+        )
+        if settings.THERAPY_RERANK_MODEL:
+            self.reranker = CrossEncoderReranker(
+                model_name=settings.THERAPY_RERANK_MODEL,
+                candidates=settings.THERAPY_RERANK_CANDIDATES,
+                keep=settings.THERAPY_RERANK_KEEP,
+                budget_seconds=settings.THERAPY_RERANK_BUDGET_MS / 1000
+            )
+        self.pdf_store = PDFVectorStore(
+            folder_path=settings.PDF_FOLDER_PATH,
+            vector_store_path=str(settings.VECTOR_STORE_PATH),
+            embedding_model_name=embedding_model_name,
+            embedding_backend=settings.THERAPY_EMBEDDING_BACKEND,
+            index_spec=settings.THERAPY_FAISS_INDEX_SPEC,
+            search_params=settings.THERAPY_FAISS_SEARCH_PARAMS,
+            mmap_index=settings.THERAPY_FAISS_MMAP,
+            read_only=True,
+            retrieval_mode=settings.THERAPY_RETRIEVAL_MODE,
+            hybrid_candidates=settings.THERAPY_HYBRID_CANDIDATES,
+            max_resident_partitions=settings.THERAPY_MAX_RESIDENT_PARTITIONS,
+            mmr_lambda=settings.THERAPY_MMR_LAMBDA,
+            mmr_candidates=settings.THERAPY_MMR_CANDIDATES,
+            cache=self.retrieval_cache,
+            reranker=self.reranker
+        )
+        if settings.THERAPY_INTENT_ROUTER:
+            # Intents are read from the database on first use, not here (this may run in AppConfig.ready()).
+            self.intent_router = IntentRouter(
+                embed_query=self.pdf_store.embed_query,
+                embed_documents=self.pdf_store.embeddings.embed_documents,
+                threshold=settings.THERAPY_INTENT_THRESHOLD,
+                max_words=settings.THERAPY_INTENT_MAX_WORDS,
+                reload_interval=settings.THERAPY_INDEX_RELOAD_INTERVAL
+            )
+        try:
+            if not self.pdf_store.load_vector_store():
+                # Building takes minutes; never do it inside a request. Serve without
+                # PDF context until the build publishes an index (see refresh_if_stale).
+                logger.warning("No vector store found; queueing build_knowledge_base_task.")
+                build_knowledge_base_task.delay()
+            if self.reranker:
+                self.reranker.warm_up()
+        except Exception as e:
+            logger.error(f"Error initializing knowledge base: {e}")
+        self._last_version_check = time.monotonic()
+
+        self.load_seconds = time.perf_counter() - started
+        self.rss_after_mb = _current_rss_mb()
+        self.loaded_at = time.time()
+        logger.info(
+            f"Knowledge base loaded in {self.load_seconds:.2f}s "
+            f"(RSS {self.rss_before_mb:.0f} MB -> {self.rss_after_mb:.0f} MB, pid {os.getpid()})"
+        )
+
+    def refresh_if_stale(self):
+        """
+        Load a newly published index version, checking the CURRENT pointer at
+        most every THERAPY_INDEX_RELOAD_INTERVAL seconds. Requests keep using
+        the previous index until the new one is fully loaded.
+        """
+        now = time.monotonic()
+        if now - self._last_version_check < settings.THERAPY_INDEX_RELOAD_INTERVAL:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_version_check = now
+            published = self.pdf_store.published_version()
+            if published and published != self.pdf_store.index_version:
+                logger.info(f"Loading published vector store version {published}")
+                self.pdf_store.load_vector_store()
+        except Exception as e:
+            logger.error(f"Error reloading knowledge base: {e}")
+        finally:
+            self._reload_lock.release()
+
+    @property
+    def vector_store_ready(self) -> bool:
+        return bool(self.pdf_store and self.pdf_store.vector_store)
+
+    def get_stats(self) -> Dict:
+        return {
+            "pid": os.getpid(),
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "rss_before_mb": self.rss_before_mb,
+            "rss_after_mb": self.rss_after_mb,
+            "rss_current_mb": _current_rss_mb(),
+            "memory": process_memory_mb(),
+            "index_mmap": bool(self.pdf_store and self.pdf_store.mmap_index),
+            "vector_store_ready": self.vector_store_ready,
+            "indexed_chunks": self.pdf_store.vector_store.index.ntotal if self.vector_store_ready else 0,
+            "index_version": self.pdf_store.index_version if self.pdf_store else None,
+            "retrieval_mode": self.pdf_store.retrieval_mode if self.pdf_store else None,
+            "partitions": self.pdf_store.manifest.get("partitions", {}) if self.pdf_store else {},
+            "resident_partitions": list(self.pdf_store.loaded.partitions) if self.pdf_store else [],
+            "retrieval_cache": self.retrieval_cache.get_stats() if self.retrieval_cache else None,
+            "reranker": self.reranker.get_stats() if self.reranker else None,
+            "intent_router": self.intent_router.get_stats() if self.intent_router else None,
+            "llm": self.llm.get_stats() if self.llm else None,
+        }
+
+
+_knowledge_base: Optional[KnowledgeBase] = None
+_knowledge_base_lock = threading.Lock()
+
+
+def get_knowledge_base() -> KnowledgeBase:
+    """Return the process-wide KnowledgeBase, loading it on first use."""
+    global _knowledge_base
+    if _knowledge_base is None:
+        with _knowledge_base_lock:
+            if _knowledge_base is None:
+                knowledge_base = KnowledgeBase()
+                knowledge_base.load()
+                _knowledge_base = knowledge_base
+    _knowledge_base.refresh_if_stale()
+    return _knowledge_base
+
+
+_llm_client: Optional[ResilientLLMClient] = None
+_llm_client_lock = threading.Lock()
+
+
+def get_llm_client() -> ResilientLLMClient:
+    """
+    Return the process-wide LLM client without loading the index, for callers
+    such as the summary task that only need completions. The KnowledgeBase
+    uses the same client, so they share one circuit breaker and latency window.
+    """
+    global _llm_client
+    if _llm_client is None:
+        with _llm_client_lock:
+            if _llm_client is None:
+                _llm_client = build_llm_client()
+    return _llm_client
+
+
+def reset_knowledge_base():
+    """Drop the cached KnowledgeBase so the next request reloads it from disk."""
+    global _knowledge_base
+    with _knowledge_base_lock:
+        _knowledge_base = None
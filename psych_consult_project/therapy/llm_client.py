@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import openai
+from openai import AsyncOpenAI, OpenAI
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth another attempt: request timeout, conflict, rate limiting and server-side failures.
+RETRYABLE_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+# Completed calls whose latency feeds the hedging delay, and how many are needed before hedging starts.
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit breaker is open."""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed call may succeed when simply tried again."""
+    if isinstance(error, openai.APIConnectionError):  # includes APITimeoutError
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUSES
+    return False
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while the provider is unhealthy. The outcomes of calls
+    in the last window_seconds are kept; once there are at least min_calls
+    of them and the share of failures reaches error_rate, the circuit opens
+    and allow() refuses calls for reset_seconds. Then a single trial call is
+    let through (half-open): success closes the circuit, failure reopens it.
+    A trial that is cancelled is released without an outcome, and one that
+    never reports back is given up after reset_seconds.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, error_rate: float = 0.5, min_calls: int = 10, window_seconds: float = 30.0,
+                 reset_seconds: float = 30.0):
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._outcomes = deque()  # (time.monotonic(), failed)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    self.counters["rejected"] += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                now = time.monotonic()
+                if self._trial_in_flight and now - self._trial_started < self.reset_seconds:
+                    self.counters["rejected"] += 1
+                    return False
+                self._trial_in_flight = True
+                self._trial_started = now
+            return True
+
+    def release(self):
+        """Give back a call that ended without an outcome (cancelled), so a half-open trial can run again."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record(self, failed: bool):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    self._failures = 0
+                return
+            self._outcomes.append((now, failed))
+            self._failures += failed
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._failures -= self._outcomes.popleft()[1]
+            calls = len(self._outcomes)
+            if self.state == self.CLOSED and calls >= self.min_calls and self._failures / calls >= self.error_rate:
+                self._open(now)
+
+    def _open(self, now: float):
+        self.state = self.OPEN
+        self._opened_at = now
+        self.counters["opened"] += 1
+        logger.warning(f"LLM circuit breaker opened; failing fast for {self.reset_seconds:g}s")
+
+    def get_stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "window_calls": len(self._outcomes),
+            "window_failures": self._failures,
+            **self.counters,
+        }
+
+
+class ResilientLLMClient:
+    """
+    Chat completions behind a deadline, retries and a circuit breaker. Each
+    call gets `deadline` seconds in total; every attempt is given what is
+    left of it as its timeout, and transient failures (timeouts, connection
+    errors, 429 and 5xx) are retried after a fully jittered exponential
+    backoff while time remains. With hedging on, a completion that is still
+    running after the p95 latency of recent calls gets a second, identical
+    request and whichever answers first wins. The breaker counts transient
+    failures only; a 400 says nothing about the provider's health.
+
+    Used by the chat views and by the standalone EmothriveAI, so it does not
+    import Django.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 model: str = "gpt-4.1-mini", timeout: float = 20.0, max_retries: int = 2,
+                 backoff_base: float = 0.25, backoff_max: float = 4.0, hedge: bool = False,
+                 hedge_min_delay: float = 1.0, hedge_workers: int = 32,
+                 breaker: Optional[CircuitBreaker] = None):
+        # Retries are done here, against the deadline, so the SDK's own are off.
+        self.client = OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.breaker = breaker or CircuitBreaker()
+        # Sync hedging needs both requests off the calling thread to race them.
+        self._hedge_pool = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="llm-hedge") if hedge else None
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self.counters = Counter()
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a completion is hedged; None until enough latencies were seen."""
+        latencies = sorted(self._latencies)
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        return max(self.hedge_min_delay, latencies[int(len(latencies) * 0.95) - 1])
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _before_attempt(self, last_error: Optional[BaseException]):
+        if not self.breaker.allow():
+            self.counters["rejected"] += 1
+            raise CircuitOpenError("The language model provider is failing; not calling it for now.") from last_error
+
+    def _after_failure(self, error: Exception, attempt: int) -> bool:
+        """Record a failed attempt; whether it may be retried."""
+        transient = is_transient(error)
+        self.breaker.record(failed=transient)
+        if transient:
+            self.counters["transient_errors"] += 1
+            logger.warning(f"LLM call attempt {attempt + 1} failed: {error}")
+        return transient
+
+    def _after_success(self, started: float, track_latency: bool):
+        self.breaker.record(failed=False)
+        if track_latency:
+            self._latencies.append(time.monotonic() - started)
+
+    def _retry_pause(self, attempt: int, deadline_at: float) -> Optional[float]:
+        """Backoff before the next attempt, or None when no attempt is left or it would not fit the deadline."""
+        if attempt >= self.max_retries:
+            return None
+        pause = self._backoff(attempt)
+        if time.monotonic() + pause >= deadline_at:
+            return None
+        self.counters["retries"] += 1
+        return pause
+
+    def _call(self, attempt_fn: Callable[[float], Any], deadline: Optional[float], track_latency: bool = True):
+        deadline_at = time.monotonic() + (deadline or self.timeout)
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self._before_attempt(last_error)
+            started = time.monotonic()
+            try:
+                result = attempt_fn(deadline_at - started)
+            except Exception as e:
+                if not self._after_failure(e, attempt):
+                    raise
+                last_error = e
+            except BaseException:
+                # Cancelled or interrupted: nothing to record, but a half-open trial must not stay taken.
+                self.breaker.release()
+                raise
+            else:
+                self._after_success(started, track_latency)
+                return result
+            pause = self._retry_pause(attempt, deadline_at)
+            if pause is None:
+                break
+            time.sleep(pause)
+        self.counters["failed"] += 1
+        raise last_error
+
+    async def _acall(self, attempt_fn, deadline: Optional[float], track_latency: bool = True):
+        deadline_at = time.monotonic() + (deadline or self.timeout)
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            self._before_attempt(last_error)
+            started = time.monotonic()
+            try:
+                result = await attempt_fn(deadline_at - started)
+            except Exception as e:
+                if not self._after_failure(e, attempt):
+                    raise
+                last_error = e
+            except BaseException:
+                # Cancelled or interrupted: nothing to record, but a half-open trial must not stay taken.
+                self.breaker.release()
+                raise
+            else:
+                self._after_success(started, track_latency)
+                return result
+            pause = self._retry_pause(attempt, deadline_at)
+            if pause is None:
+                break
+            await asyncio.sleep(pause)
+        self.counters["failed"] += 1
+        raise last_error
+
+    def _create(self, messages: List[Dict], timeout: float, kwargs: Dict):
+        return self.client.chat.completions.create(
+            model=kwargs.pop("model", self.model), messages=messages, timeout=timeout, **kwargs
+        )
+
+    async def _acreate(self, messages: List[Dict], timeout: float, kwargs: Dict):
+        return await self.async_client.chat.completions.create(
+            model=kwargs.pop("model", self.model), messages=messages, timeout=timeout, **kwargs
+        )
+
+    def _hedged_create(self, messages: List[Dict], timeout: float, kwargs: Dict):
+        delay = self.hedge_delay() if self.hedge else None
+        if delay is None or delay >= timeout:
+            return self._create(messages, timeout, dict(kwargs))
+        primary = self._hedge_pool.submit(self._create, messages, timeout, dict(kwargs))
+        if wait([primary], timeout=delay).done:
+            return primary.result()
+        self.counters["hedged"] += 1
+        hedge = self._hedge_pool.submit(self._create, messages, timeout - delay, dict(kwargs))
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # The slower request is left to finish (or time out) on its own thread.
+                    self.counters["hedge_won" if future is hedge else "primary_won"] += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _ahedged_create(self, messages: List[Dict], timeout: float, kwargs: Dict):
+        delay = self.hedge_delay() if self.hedge else None
+        if delay is None or delay >= timeout:
+            return await self._acreate(messages, timeout, dict(kwargs))
+        primary = asyncio.ensure_future(self._acreate(messages, timeout, dict(kwargs)))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        self.counters["hedged"] += 1
+        hedge = asyncio.ensure_future(self._acreate(messages, timeout - delay, dict(kwargs)))
+        pending, error = {primary, hedge}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.counters["hedge_won" if task is hedge else "primary_won"] += 1
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    def complete(self, messages: List[Dict], deadline: Optional[float] = None, **kwargs):
+        """ChatCompletion for messages; extra keyword arguments go to chat.completions.create."""
+        return self._call(lambda timeout: self._hedged_create(messages, timeout, kwargs), deadline)
+
+    async def acomplete(self, messages: List[Dict], deadline: Optional[float] = None, **kwargs):
+        return await self._acall(lambda timeout: self._ahedged_create(messages, timeout, kwargs), deadline)
+
+    def stream(self, messages: List[Dict], deadline: Optional[float] = None, **kwargs) -> Iterator[str]:
+        """
+        Completion text as it is generated. Opening the stream is retried like
+        a completion; once tokens flow, a failure is raised to the caller, who
+        has already forwarded part of the answer. Streams are never hedged.
+        """
+        kwargs["stream"] = True
+        stream = self._call(lambda timeout: self._create(messages, timeout, dict(kwargs)), deadline,
+                            track_latency=False)
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                yield token
+
+    def get_stats(self) -> Dict:
+        latencies = sorted(self._latencies)
+        hedge_delay = self.hedge_delay()
+        return {
+            "model": self.model,
+            "timeout_s": self.timeout,
+            "max_retries": self.max_retries,
+            "hedge": self.hedge,
+            "hedge_delay_ms": hedge_delay * 1000 if hedge_delay is not None else None,
+            "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+            "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000 if len(latencies) >= MIN_LATENCY_SAMPLES else None,
+            "breaker": self.breaker.get_stats(),
+            **self.counters,
+        }
@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from therapy.pdf_processor import EMBEDDING_BACKENDS, PDFVectorStore, create_embeddings
+import random
+import statistics
+import time
+
+DEFAULT_QUERIES = [
+    "I feel anxious all the time and can't stop worrying",
+    "How do I use the TIPP skill when I'm overwhelmed?",
+    "What is a cognitive distortion?",
+    "I lost my mother last year and still can't cope",
+    "My child has angry outbursts every evening",
+    "I feel hopeless and sad most days",
+    "How can I accept difficult thoughts instead of fighting them?",
+    "I keep having flashbacks of the accident",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares embedding backends on the therapy/pdf knowledge base: per-query latency, batch '
+        'throughput and recall@k of retrieval against the reference "torch" backend.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', default=','.join(EMBEDDING_BACKENDS), help='Comma-separated backends to compare.')
+        parser.add_argument('--top-k', type=int, default=3)
+        parser.add_argument('--sample-chunks', type=int, default=50, help='Indexed chunks also used as queries.')
+        parser.add_argument('--batch-size', type=int, default=64)
+        parser.add_argument('--repeat', type=int, default=3, help='Timed passes per query.')
+
+    def handle(self, *args, **options):
+        store = PDFVectorStore(folder_path=settings.PDF_FOLDER_PATH, vector_store_path=str(settings.VECTOR_STORE_PATH))
+        if not store.load_vector_store():
+            raise CommandError("No vector store found. Run `manage.py build_knowledge_base` first.")
+
+        chunk_texts = [doc.page_content for doc in store.vector_store.docstore._dict.values()]
+        random.seed(0)
+        sampled = random.sample(chunk_texts, min(options['sample_chunks'], len(chunk_texts)))
+        queries = DEFAULT_QUERIES + [text[:200] for text in sampled]
+        batch = chunk_texts[:options['batch_size']]
+        top_k = options['top_k']
+
+        reference = {q: store._search_chunk_ids(store.embeddings.embed_query(q), top_k) for q in queries}
+
+        self.stdout.write(f"{len(queries)} queries, top_k={top_k}, batch of {len(batch)} chunks")
+        self.stdout.write(f"{'backend':<12} {'load s':>7} {'query ms':>9} {'p95 ms':>7} {'chunks/s':>9} {'recall@k':>9}")
+        for backend in options['backends'].split(','):
+            try:
+                started = time.perf_counter()
+                embeddings = create_embeddings(store.embedding_model_name, backend)
+                embeddings.embed_query("warm up")
+                load_seconds = time.perf_counter() - started
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f"{backend:<12} unavailable: {e}"))
+                continue
+
+            latencies = []
+            hits = 0
+            for query in queries:
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    vector = embeddings.embed_query(query)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                found = store._search_chunk_ids(vector, top_k)
+                hits += len(set(found) & set(reference[query]))
+
+            started = time.perf_counter()
+            embeddings.embed_documents(batch)
+            throughput = len(batch) / (time.perf_counter() - started)
+
+            latencies.sort()
+            self.stdout.write(
+                f"{backend:<12} {load_seconds:>7.2f} {statistics.mean(latencies):>9.2f} "
+                f"{latencies[int(len(latencies) * 0.95) - 1]:>7.2f} {throughput:>9.1f} "
+                f"{hits / (len(queries) * top_k):>9.3f}"
+            )
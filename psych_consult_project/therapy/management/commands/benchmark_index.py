@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from therapy.pdf_processor import PDFVectorStore, create_faiss_index
+import faiss
+import numpy as np
+import statistics
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks FAISS index specs on the knowledge base vectors: build time, index size, query latency '
+        'and recall@k against the exact flat index. Specs are separated by ";" and may carry search '
+        'parameters after "|", e.g. "HNSW32|efSearch=64;IVF256,PQ48|nprobe=16".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--specs', default='Flat;HNSW32|efSearch=64;IVF256,PQ48|nprobe=16')
+        parser.add_argument('--top-k', type=int, default=3)
+        parser.add_argument('--queries', type=int, default=200, help='Indexed vectors reused as queries.')
+
+    def handle(self, *args, **options):
+        store = PDFVectorStore(folder_path=settings.PDF_FOLDER_PATH, vector_store_path=str(settings.VECTOR_STORE_PATH))
+        if not store.load_vector_store():
+            raise CommandError("No vector store found. Run `manage.py build_knowledge_base` first.")
+        if not isinstance(store.vector_store.index, faiss.IndexFlat):
+            raise CommandError("The published index is not Flat; rebuild it with THERAPY_FAISS_INDEX_SPEC=Flat to benchmark.")
+
+        index = store.vector_store.index
+        vectors = index.reconstruct_n(0, index.ntotal)
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(len(vectors), size=min(options['queries'], len(vectors)), replace=False)]
+        top_k = options['top_k']
+        _, truth = index.search(queries, top_k)
+
+        self.stdout.write(f"{len(vectors)} vectors of dim {vectors.shape[1]}, {len(queries)} queries, top_k={top_k}")
+        self.stdout.write(f"{'spec':<28} {'build s':>8} {'size MB':>8} {'query ms':>9} {'p95 ms':>7} {'recall@k':>9}")
+        for entry in options['specs'].split(';'):
+            spec, _, search_params = entry.partition('|')
+            try:
+                started = time.perf_counter()
+                candidate = create_faiss_index(vectors.shape[1], spec, search_params)
+                if not candidate.is_trained:
+                    candidate.train(vectors)
+                candidate.add(vectors)
+                build_seconds = time.perf_counter() - started
+            except RuntimeError as e:
+                self.stdout.write(self.style.WARNING(f"{entry:<28} failed: {e}"))
+                continue
+
+            latencies = []
+            found = np.empty_like(truth)
+            for i, query in enumerate(queries):
+                started = time.perf_counter()
+                _, ids = candidate.search(query.reshape(1, -1), top_k)
+                latencies.append((time.perf_counter() - started) * 1000)
+                found[i] = ids[0]
+            recall = np.mean([len(set(f) & set(t)) / top_k for f, t in zip(found, truth)])
+            size_mb = faiss.serialize_index(candidate).nbytes / (1024 * 1024)
+
+            latencies.sort()
+            self.stdout.write(
+                f"{entry:<28} {build_seconds:>8.2f} {size_mb:>8.2f} {statistics.mean(latencies):>9.3f} "
+                f"{latencies[int(len(latencies) * 0.95) - 1]:>7.3f} {recall:>9.3f}"
+            )
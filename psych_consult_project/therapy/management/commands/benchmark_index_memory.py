@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from therapy.knowledge_base import process_memory_mb
+from therapy.pdf_processor import PDFVectorStore
+import multiprocessing
+import numpy as np
+
+
+def _load_in_worker(mmap_index, barrier, results):
+    store = PDFVectorStore(
+        folder_path=settings.PDF_FOLDER_PATH,
+        vector_store_path=str(settings.VECTOR_STORE_PATH),
+        index_spec=settings.THERAPY_FAISS_INDEX_SPEC,
+        mmap_index=mmap_index,
+        read_only=True
+    )
+    before = process_memory_mb()
+    loaded = store.load_vector_store()
+    if loaded:
+        # Touch the whole index the way a warmed-up worker would.
+        index = store.vector_store.index
+        index.search(np.zeros((1, index.d), dtype=np.float32), min(10, max(index.ntotal, 1)))
+    after = process_memory_mb()
+    # Measure while every worker still holds its index, so shared pages are split across all of them.
+    barrier.wait()
+    results.put({"loaded": loaded, **{key: after[key] - before[key] for key in after}})
+    barrier.wait()
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads the published knowledge base in N concurrent worker processes, once into private memory '
+        'and once memory-mapped, and reports the per-worker memory added by the index (RSS, PSS, private, shared).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        context = multiprocessing.get_context('fork')
+        self.stdout.write(f"{'mode':<8} {'workers':>7} {'rss MB':>8} {'pss MB':>8} {'private MB':>10} {'shared MB':>9}")
+        for mmap_index in (False, True):
+            barrier = context.Barrier(workers)
+            results = context.Queue()
+            processes = [context.Process(target=_load_in_worker, args=(mmap_index, barrier, results)) for _ in range(workers)]
+            for process in processes:
+                process.start()
+            samples = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            if not all(sample["loaded"] for sample in samples):
+                raise CommandError("Workers could not load the vector store. Run `manage.py build_knowledge_base` first.")
+
+            average = {key: sum(sample[key] for sample in samples) / workers for key in ("rss_mb", "pss_mb", "private_mb", "shared_mb")}
+            self.stdout.write(
+                f"{'mmap' if mmap_index else 'heap':<8} {workers:>7} {average['rss_mb']:>8.1f} {average['pss_mb']:>8.1f} "
+                f"{average['private_mb']:>10.1f} {average['shared_mb']:>9.1f}"
+            )
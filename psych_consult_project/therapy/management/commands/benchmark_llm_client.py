@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from therapy.llm_client import CircuitBreaker, CircuitOpenError, ResilientLLMClient
+import asyncio
+import json
+import time
+
+MESSAGES = [{"role": "user", "content": "I've been feeling anxious before work every morning."}]
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends chat completions through therapy.llm_client.ResilientLLMClient and reports success rate, '
+        'latency and what the retries, hedging and circuit breaker did. Run it against '
+        '`manage.py fake_llm_server --slow-rate 0.05 --error-rate 0.2` to check the policies end to end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8089/v1')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=10)
+        parser.add_argument('--deadline', type=float, default=settings.THERAPY_LLM_TIMEOUT)
+        parser.add_argument('--max-retries', type=int, default=settings.THERAPY_LLM_MAX_RETRIES)
+        parser.add_argument('--hedge', action='store_true', default=settings.THERAPY_LLM_HEDGE)
+        parser.add_argument('--hedge-min-delay-ms', type=int, default=settings.THERAPY_LLM_HEDGE_MIN_DELAY_MS)
+
+    def handle(self, *args, **options):
+        client = ResilientLLMClient(
+            api_key=settings.OPENAI_API_KEY or 'fake-key',
+            base_url=options['base_url'],
+            model=settings.THERAPY_LLM_MODEL,
+            timeout=options['deadline'],
+            max_retries=options['max_retries'],
+            hedge=options['hedge'],
+            hedge_min_delay=options['hedge_min_delay_ms'] / 1000,
+            breaker=CircuitBreaker(
+                error_rate=settings.THERAPY_LLM_BREAKER_ERROR_RATE,
+                min_calls=settings.THERAPY_LLM_BREAKER_MIN_CALLS,
+                window_seconds=settings.THERAPY_LLM_BREAKER_WINDOW_SECONDS,
+                reset_seconds=settings.THERAPY_LLM_BREAKER_RESET_SECONDS
+            )
+        )
+        outcomes, latencies, elapsed = asyncio.run(self._run(client, options))
+
+        latencies.sort()
+        self.stdout.write(
+            f"{options['requests']} requests in {elapsed:.2f}s: {outcomes['ok']} ok, "
+            f"{outcomes['circuit_open']} failed fast (circuit open), {outcomes['error']} failed"
+        )
+        if latencies:
+            self.stdout.write(
+                f"successful latency p50 {latencies[len(latencies) // 2]:.3f}s, "
+                f"p95 {latencies[max(int(len(latencies) * 0.95) - 1, 0)]:.3f}s, max {latencies[-1]:.3f}s"
+            )
+        self.stdout.write(json.dumps(client.get_stats(), indent=2))
+
+    async def _run(self, client, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        outcomes = {"ok": 0, "circuit_open": 0, "error": 0}
+        latencies = []
+
+        async def one_call():
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    await client.acomplete(MESSAGES, max_tokens=300)
+                except CircuitOpenError:
+                    outcomes["circuit_open"] += 1
+                except Exception:
+                    outcomes["error"] += 1
+                else:
+                    outcomes["ok"] += 1
+                    latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_call() for _ in range(options['requests'])))
+        return outcomes, latencies, time.perf_counter() - started
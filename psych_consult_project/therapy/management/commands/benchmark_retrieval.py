@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from therapy.pdf_processor import PDFVectorStore
+from therapy.reranker import CrossEncoderReranker
+import statistics
+import time
+
+# Queries paired with terms a relevant chunk must contain; exact clinical vocabulary is
+# where embedding-only retrieval tends to miss.
+DEFAULT_CASES = [
+    ("How do I use the TIPP skill when I'm overwhelmed?", ["tipp"]),
+    ("What is DBT?", ["dbt", "dialectical"]),
+    ("Examples of cognitive distortions like catastrophizing", ["distortion", "catastroph"]),
+    ("How does exposure and response prevention work for OCD?", ["exposure", "response prevention"]),
+    ("What is radical acceptance?", ["radical acceptance"]),
+    ("Opposite action for intense emotions", ["opposite action"]),
+    ("Thought record worksheet for negative automatic thoughts", ["thought record", "automatic thought"]),
+    ("Behavioral activation for depression", ["behavioral activation", "behavioural activation"]),
+    ("What does ACT mean by cognitive defusion?", ["defusion"]),
+    ("Grounding techniques for panic attacks", ["grounding", "panic"]),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compares vector-only and hybrid (BM25 + vector, reciprocal rank fusion) retrieval on the published '
+        'knowledge base: query latency and hit rate, i.e. the share of top-k chunks that contain one of the '
+        'expected terms of each labeled query. Both modes are also measured with maximal marginal relevance '
+        '(unless --mmr-lambda is 0) and, with --rerank-model, with cross-encoder re-ranking of over-fetched '
+        'candidates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query and mode.')
+        parser.add_argument('--candidates', type=int, default=settings.THERAPY_HYBRID_CANDIDATES)
+        parser.add_argument('--rerank-model', default=settings.THERAPY_RERANK_MODEL)
+        parser.add_argument('--rerank-candidates', type=int, default=settings.THERAPY_RERANK_CANDIDATES)
+        parser.add_argument('--mmr-lambda', type=float, default=settings.THERAPY_MMR_LAMBDA or 0)
+        parser.add_argument('--mmr-candidates', type=int, default=settings.THERAPY_MMR_CANDIDATES)
+
+    def handle(self, *args, **options):
+        store = PDFVectorStore(
+            folder_path=settings.PDF_FOLDER_PATH,
+            vector_store_path=str(settings.VECTOR_STORE_PATH),
+            embedding_backend=settings.THERAPY_EMBEDDING_BACKEND,
+            search_params=settings.THERAPY_FAISS_SEARCH_PARAMS,
+            read_only=True,
+            hybrid_candidates=options['candidates'],
+            mmr_candidates=options['mmr_candidates']
+        )
+        if not store.load_vector_store():
+            raise CommandError("No vector store found. Run `manage.py build_knowledge_base` first.")
+        if not store.chunk_store or not store.chunk_store.search_bm25("therapy", 1):
+            self.stdout.write(self.style.WARNING(
+                "The published index has no BM25 index (or it matched nothing); rebuild it with "
+                "`manage.py build_knowledge_base --full` for a meaningful comparison."
+            ))
+
+        top_k = options['top_k']
+        # Embed every query once up front and serve the vectors from memory, so both modes are timed on
+        # search alone (the store has no RetrievalCache, which would also cache the results being timed).
+        query_vectors = {query: store.embeddings.embed_query(query) for query, _ in DEFAULT_CASES}
+        store.embed_query = query_vectors.__getitem__
+
+        self.stdout.write(f"{store.vector_store.index.ntotal} chunks, {len(DEFAULT_CASES)} queries, top_k={top_k}")
+        # (label, mode, reranker, MMR lambda); the plain modes are first-stage order only.
+        runs = [("vector", "vector", None, None), ("hybrid", "hybrid", None, None)]
+        if options['mmr_lambda']:
+            runs += [("vector+mmr", "vector", None, options['mmr_lambda']),
+                     ("hybrid+mmr", "hybrid", None, options['mmr_lambda'])]
+        if options['rerank_model']:
+            # No budget here: the point is to measure what re-ranking costs and buys.
+            reranker = CrossEncoderReranker(options['rerank_model'], candidates=options['rerank_candidates'],
+                                            keep=top_k, budget_seconds=float('inf'))
+            reranker.warm_up()
+            runs += [("vector+rerank", "vector", reranker, None), ("hybrid+rerank", "hybrid", reranker, None)]
+
+        self.stdout.write(f"{'mode':<16} {'mean ms':>8} {'p95 ms':>7} {'hit rate':>9} {'queries hit':>12}")
+        for label, mode, reranker, mmr_lambda in runs:
+            store.reranker = reranker
+            store.mmr_lambda = mmr_lambda
+            latencies = []
+            hits = []
+            for query, terms in DEFAULT_CASES:
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    docs = store.similarity_search(query, top_k, mode)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                texts = [doc.page_content.lower() for doc in docs]
+                hits.append([any(term in text for term in terms) for text in texts])
+
+            latencies.sort()
+            hit_rate = statistics.mean(sum(h) / top_k for h in hits)
+            queries_hit = sum(any(h) for h in hits)
+            self.stdout.write(
+                f"{label:<16} {statistics.mean(latencies):>8.3f} {latencies[int(len(latencies) * 0.95) - 1]:>7.3f} "
+                f"{hit_rate:>9.3f} {queries_hit:>7}/{len(DEFAULT_CASES)}"
+            )
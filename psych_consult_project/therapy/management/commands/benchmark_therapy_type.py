@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from therapy.prompt import PromptManager
+import statistics
+import time
+
+SAMPLE_MESSAGE = (
+    "Lately I've been feeling overwhelmed at work and at home. I can't sleep, I keep replaying "
+    "conversations in my head and my therapist mentioned DBT skills. What do you think I should try first? "
+)
+
+
+class Command(BaseCommand):
+    help = 'Times PromptManager.detect_therapy_type on short and long messages (microseconds per call).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=5, help='Timed rounds; the median is reported.')
+
+    def handle(self, *args, **options):
+        prompt_manager = PromptManager()
+        iterations = options['iterations']
+        self.stdout.write(f"{'message chars':>13} {'median us':>10} {'min us':>8} {'detected':>10}")
+        for copies in (1, 10, 50):
+            message = SAMPLE_MESSAGE * copies
+            rounds = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    detected = prompt_manager.detect_therapy_type(message)
+                rounds.append((time.perf_counter() - started) / iterations * 1e6)
+            self.stdout.write(
+                f"{len(message):>13} {statistics.median(rounds):>10.1f} {min(rounds):>8.1f} {detected.name:>10}"
+            )
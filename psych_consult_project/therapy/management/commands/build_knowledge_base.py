@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from therapy.kb_builder import BuildInProgress, KnowledgeBaseBuilder
+from therapy.pdf_processor import PDFVectorStore
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Builds or incrementally updates the therapy knowledge base (FAISS index) from the PDF folder, resuming from checkpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Re-embed every PDF instead of only new or changed ones.')
+        parser.add_argument('--no-resume', action='store_true', help='Discard any checkpoint left by an interrupted build.')
+        parser.add_argument('--checkpoint-every', type=int, default=20, help='Embedding batches between checkpoints.')
+        parser.add_argument('--batch-size', type=int, default=64, help='Chunks embedded per batch.')
+        parser.add_argument('--workers', type=int, default=None, help='PDF extraction processes (default: CPU count).')
+
+    def handle(self, *args, **options):
+        pdf_store = PDFVectorStore(
+            folder_path=settings.PDF_FOLDER_PATH,
+            vector_store_path=str(settings.VECTOR_STORE_PATH),
+            embedding_backend=settings.THERAPY_EMBEDDING_BACKEND,
+            index_spec=settings.THERAPY_FAISS_INDEX_SPEC,
+            search_params=settings.THERAPY_FAISS_SEARCH_PARAMS,
+            document_types=settings.THERAPY_DOCUMENT_TYPES,
+            classify_documents=settings.THERAPY_CLASSIFY_DOCUMENTS,
+            dedup_threshold=settings.THERAPY_DEDUP_THRESHOLD,
+            extraction_workers=options['workers'],
+            embedding_batch_size=options['batch_size']
+        )
+        builder = KnowledgeBaseBuilder(
+            pdf_store,
+            checkpoint_every=options['checkpoint_every'],
+            report=lambda message: self.stdout.write(message)
+        )
+        try:
+            stats = builder.build(resume=not options['no_resume'], full=options['full'])
+        except BuildInProgress as e:
+            self.stdout.write(self.style.WARNING(str(e)))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Knowledge base ready: {stats['files']} PDFs, {stats['pages']} pages and {stats['chunks']} chunks indexed "
+            f"in {stats['seconds']:.1f}s ({stats['pages_per_second']:.1f} pages/s, {stats['chunks_per_second']:.1f} chunks/s)."
+        ))
+        logger.info(f"Knowledge base build finished: {stats}")
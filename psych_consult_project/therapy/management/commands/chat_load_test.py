@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+import asyncio
+import statistics
+import time
+import httpx
+
+
+class Command(BaseCommand):
+    help = (
+        'Fires concurrent chat turns at a running chat endpoint and reports throughput and latency per '
+        'concurrency level. Run the app with OPENAI_BASE_URL pointing at `manage.py fake_llm_server` so '
+        'the LLM latency is fixed; an async worker should then scale roughly linearly with concurrency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000/api/therapy/chat/async/')
+        parser.add_argument('--token', required=True, help='JWT access token of a test user.')
+        parser.add_argument('--concurrency', default='1,10,50,100', help='Comma-separated concurrency levels.')
+        parser.add_argument('--rounds', type=int, default=3, help='Requests per in-flight slot at each level.')
+        parser.add_argument('--timeout', type=float, default=120.0)
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        self.stdout.write(f"{'concurrency':>11} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 s':>7} {'p95 s':>7}")
+        for level in levels:
+            result = asyncio.run(self._run_level(options, level))
+            self.stdout.write(
+                f"{level:>11} {result['requests']:>8} {result['errors']:>6} {result['throughput']:>8.2f} "
+                f"{result['p50']:>7.2f} {result['p95']:>7.2f}"
+            )
+
+    async def _run_level(self, options, level):
+        total = level * options['rounds']
+        semaphore = asyncio.Semaphore(level)
+        latencies = []
+        errors = 0
+        headers = {'Authorization': f"Bearer {options['token']}"}
+
+        async with httpx.AsyncClient(timeout=options['timeout'], limits=httpx.Limits(max_connections=level)) as client:
+            async def one_turn(i):
+                nonlocal errors
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        response = await client.post(options['url'], json={'message': f'load test message {i}'}, headers=headers)
+                        if response.status_code != 200:
+                            errors += 1
+                    except httpx.HTTPError:
+                        errors += 1
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one_turn(i) for i in range(total)))
+            elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            'requests': total,
+            'errors': errors,
+            'throughput': total / elapsed,
+            'p50': statistics.median(latencies),
+            'p95': latencies[max(0, int(len(latencies) * 0.95) - 1)],
+        }
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from aiohttp import web
+import asyncio
+import json
+import random
+import time
+import uuid
+
+FAKE_REPLY = "It sounds like you're carrying a lot right now. Let's take it one step at a time together."
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs a local OpenAI-compatible /v1/chat/completions server with fixed latency, for load tests. '
+        'A share of requests can be made slow or answered with an error status, to exercise the retries, '
+        'hedging and circuit breaker of therapy.llm_client (see `manage.py benchmark_llm_client`).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8089)
+        parser.add_argument('--latency', type=float, default=2.0, help='Seconds to wait before answering each request.')
+        parser.add_argument('--slow-rate', type=float, default=0.0, help='Share of requests answered after --slow-latency.')
+        parser.add_argument('--slow-latency', type=float, default=10.0)
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests failed with --error-status.')
+        parser.add_argument('--error-status', type=int, default=503)
+
+    def handle(self, *args, **options):
+        latency = options['latency']
+
+        async def chat_completions(request):
+            body = await request.json()
+            request_latency = options['slow_latency'] if random.random() < options['slow_rate'] else latency
+            if random.random() < options['error_rate']:
+                return web.json_response(
+                    {'error': {'message': 'Injected failure', 'type': 'server_error', 'code': None}},
+                    status=options['error_status']
+                )
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            created = int(time.time())
+            model = body.get('model', 'fake-model')
+
+            if body.get('stream'):
+                response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+                await response.prepare(request)
+                words = FAKE_REPLY.split(' ')
+                for i, word in enumerate(words):
+                    await asyncio.sleep(request_latency / len(words))
+                    chunk = {
+                        'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                        'choices': [{'index': 0, 'delta': {'content': word if i == 0 else f' {word}'}, 'finish_reason': None}],
+                    }
+                    await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                await response.write(b"data: [DONE]\n\n")
+                await response.write_eof()
+                return response
+
+            await asyncio.sleep(request_latency)
+            return web.json_response({
+                'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': FAKE_REPLY}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+            })
+
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', chat_completions)
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake LLM listening on http://{options['host']}:{options['port']}/v1 (latency {latency}s, "
+            f"{options['slow_rate']:.0%} slow, {options['error_rate']:.0%} errors). "
+            f"Point the app at it with OPENAI_BASE_URL."
+        ))
+        web.run_app(app, host=options['host'], port=options['port'], print=None)
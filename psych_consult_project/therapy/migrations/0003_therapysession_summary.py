@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('therapy', '0002_remove_therapychatmessage_user_therapysession_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='therapysession',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='therapysession',
+            name='summary_last_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='therapysession',
+            name='summary_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
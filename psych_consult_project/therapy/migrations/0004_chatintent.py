@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+# The canned replies that used to live in ai new file integration/main.py as exact-match strings.
+INITIAL_INTENTS = [
+    {
+        'name': 'greeting',
+        'examples': "hi\nhello\nhello there\nhey\nhi there\ngood morning\ngood evening",
+        'reply': "Hello! How can I support you today?",
+    },
+    {
+        'name': 'how_are_you',
+        'examples': "how are you?\nhow are you doing?\nhow's it going?\nhow are you today?",
+        'reply': "I'm here and ready to help. How are you feeling today?",
+    },
+]
+
+
+def create_initial_intents(apps, schema_editor):
+    ChatIntent = apps.get_model('therapy', 'ChatIntent')
+    for intent in INITIAL_INTENTS:
+        ChatIntent.objects.get_or_create(name=intent['name'], defaults=intent)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('therapy', '0003_therapysession_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatIntent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('examples', models.TextField(help_text='Example messages, one per line.')),
+                ('reply', models.TextField()),
+                ('threshold', models.FloatField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RunPython(create_initial_intents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-17 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('therapy', '0004_chatintent'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='therapychatmessage',
+            index=models.Index(fields=['session', 'timestamp', 'id'], name='therapy_msg_session_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('therapy', '0005_therapychatmessage_session_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='therapysession',
+            name='summary_generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
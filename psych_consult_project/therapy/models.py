@@ -10,6 +10,13 @@ class TherapySession(models.Model):
     title = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Rolling summary of every message up to and including summary_last_message_id,
+    # maintained by therapy.tasks.summarize_therapy_session_task.
+    summary = models.TextField(blank=True, default='')
+    summary_last_message_id = models.BigIntegerField(blank=True, null=True)
+    summary_updated_at = models.DateTimeField(blank=True, null=True)
+    # Bumped whenever the summary is discarded, so a summary run that started before cannot write it back.
+    summary_generation = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['-updated_at'] # Order by most recently updated sessions
@@ -25,6 +32,34 @@ class TherapyChatMessage(models.Model):
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Keyset pagination and history paging walk a session's messages by (timestamp, id).
+            models.Index(fields=['session', 'timestamp', 'id'], name='therapy_msg_session_ts_idx'),
+        ]
 
     def __str__(self):
         return f"Message in {self.session.title or self.session.id} at {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
+
+class ChatIntent(models.Model):
+    """
+    Canned reply for small talk ("hi", "how are you") that the chat views
+    send without retrieval or an LLM call when a message is close enough
+    to one of the examples (see therapy.intent_router.IntentRouter).
+    """
+    name = models.CharField(max_length=100, unique=True)
+    examples = models.TextField(help_text="Example messages, one per line.")
+    reply = models.TextField()
+    # Cosine similarity a message needs to reach; empty uses THERAPY_INTENT_THRESHOLD.
+    threshold = models.FloatField(blank=True, null=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+    def example_list(self):
+        return [line.strip() for line in self.examples.splitlines() if line.strip()]
@@ -0,0 +1,63 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination of chat messages, newest first, on (timestamp, id).
+    A page that has older messages ends with a cursor; passing it back as
+    `before` continues from there (infinite scroll upwards). Every page is
+    one range scan of the (session, timestamp, id) index, so its cost does
+    not grow with the length of the session, and messages added meanwhile
+    do not shift later pages the way offsets would.
+    """
+    page_size = 30
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    cursor_query_param = 'before'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_page_size(request)
+        before = request.query_params.get(self.cursor_query_param)
+        if before:
+            timestamp, pk = self.decode_cursor(before)
+            queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+        # One extra row tells whether an older page exists without a COUNT(*).
+        rows = list(queryset.order_by('-timestamp', '-id')[:limit + 1])
+        self.has_more = len(rows) > limit
+        self.page = rows[:limit]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, message) -> str:
+        return base64.urlsafe_b64encode(f"{message.timestamp.isoformat()}|{message.pk}".encode()).decode()
+
+    def decode_cursor(self, cursor: str):
+        try:
+            timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+            return datetime.fromisoformat(timestamp), int(pk)
+        except ValueError:  # also covers bad base64 and undecodable bytes
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_paginated_response(self, data):
+        before = self.encode_cursor(self.page[-1]) if self.has_more else None
+        return Response({
+            'before': before,
+            'next': replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, before)
+            if before else None,
+            'results': data,
+        })
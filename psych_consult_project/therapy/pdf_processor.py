@@ -1,14 +1,36 @@
 import os
+import re
+import json
+import time
+import uuid
+import shutil
+import pickle
+import fnmatch
+import hashlib
 import logging
-from typing import List, Dict, Optional
-from dataclasses import dataclass
+import threading
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
+from dataclasses import dataclass, field, replace
+import faiss
+import numpy as np
 import PyPDF2
 from pdfplumber import PDF
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
 from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+from .dedup import MinHashDeduplicator
+from .chunk_store import CHUNKS_FILE, SQLiteChunkStore, SQLiteIndexMapping, write_chunk_store
+from .prompt import CONTEXT_SEPARATOR, PromptManager, TherapyType
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,15 +41,268 @@ class PDFDocument:
     content: str
     metadata: Dict
     page_count: int
+    file_hash: str = ""
+
+INDEX_VERSION_FILE = "index_version"
+# Published indexes live in <vector_store_path>/versions/<version>/; CURRENT names the live one.
+VERSIONS_DIR = "versions"
+CURRENT_VERSION_FILE = "CURRENT"
+# Published versions kept on disk, so processes still loading an older one are not cut off.
+KEEP_VERSIONS = 2
+# Per-file content hashes and chunk ids of what is in the index, used for incremental rebuilds.
+MANIFEST_FILE = "manifest.json"
+# index_factory storage whose remove_ids compacts row numbers (Flat, SQ8, PQ48, LSH; not fast-scan PQ).
+_COMPACTING_STORAGE = re.compile(r"FLAT|SQ(FP16|BF16|\d+)|PQ\d+(X\d+)?|LSH\w*")
+# "vector" ranks chunks by embedding similarity only; "hybrid" fuses it with a BM25 ranking.
+RETRIEVAL_MODES = ("vector", "hybrid")
+# Per-therapy-type sub-indexes of a published version, partitions/<therapy_type>.faiss. Their FAISS ids
+# are row positions in the global index, so hits resolve through the same chunk store.
+PARTITIONS_DIR = "partitions"
+# Chunks of this type only live in the global index; it is also what unclassified queries search.
+GLOBAL_PARTITION = TherapyType.GENERAL.name.lower()
+# Reciprocal rank fusion constant; 60 is the value from the original RRF paper.
+RRF_K = 60
+
+@dataclass(frozen=True)
+class LoadedIndex:
+    """
+    Everything a search reads from one index version. PDFVectorStore replaces
+    it as a whole, and each search captures it once, so a search that spans
+    a reload never maps one version's row positions through another's chunks.
+    """
+    vector_store: Optional[FAISS] = None
+    # SQLiteChunkStore of the loaded index; holds the BM25 (FTS5) index used by hybrid mode.
+    chunk_store: Optional[SQLiteChunkStore] = None
+    # Changes whenever the index is rebuilt; cached retrieval results are keyed on it.
+    index_version: Optional[str] = None
+    manifest: Dict = field(default_factory=dict)
+    loaded_path: Optional[str] = None
+    # Partition sub-indexes of this version read so far, least recently used first.
+    partitions: "OrderedDict[str, Optional[faiss.Index]]" = field(default_factory=OrderedDict)
+
+def _loaded_attribute(name: str) -> property:
+    """PDFVectorStore attribute kept in its LoadedIndex; assigning it publishes a new one."""
+    def set_attribute(store, value):
+        # Partitions belong to the index they were read for, so any change starts without them.
+        store.loaded = replace(store.loaded, partitions=OrderedDict(), **{name: value})
+    return property(lambda store: getattr(store.loaded, name), set_attribute)
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id_prefix(filename: str, file_hash: str) -> str:
+    """
+    Prefix of the chunk ids of one PDF: its content hash plus a hash of its
+    name, so byte-identical copies stored under different names get ids of
+    their own and removing one copy never deletes the other's chunks.
+    """
+    name_hash = hashlib.sha256(filename.encode('utf-8')).hexdigest()[:8]
+    return f"{file_hash[:16]}-{name_hash}-"
+
+def _extract_with_pdfplumber(file_path: str) -> Tuple[List[str], int]:
+    try:
+        with PDF.open(file_path) as pdf:
+            pages = []
+            for page in pdf.pages:
+                page_text = page.extract_text()
+                if page_text:
+                    pages.append(page_text)
+            return pages, len(pdf.pages)
+    except Exception as e:
+        logger.warning(f"pdfplumber extraction failed: {e}")
+        return [], 0
+
+def _extract_with_pypdf2(file_path: str) -> Tuple[List[str], int]:
+    try:
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            pages = []
+            for page in pdf_reader.pages:
+                page_text = page.extract_text()
+                if page_text:
+                    pages.append(page_text)
+            return pages, len(pdf_reader.pages)
+    except Exception as e:
+        logger.warning(f"PyPDF2 extraction failed: {e}")
+        return [], 0
+
+def extract_pdf(file_path: str) -> Tuple[str, int, str]:
+    """
+    Parse one PDF (PyPDF2 only as a fallback when pdfplumber finds no text)
+    and return (content, page_count, sha256). Module-level so it can run in
+    a process pool.
+    """
+    pages, page_count = _extract_with_pdfplumber(file_path)
+    if not pages:
+        pages, fallback_page_count = _extract_with_pypdf2(file_path)
+        page_count = page_count or fallback_page_count
+    return "\n".join(pages).strip(), page_count, file_sha256(file_path)
+
+def _torch_embeddings(model_name: str) -> Embeddings:
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+def _torch_int8_embeddings(model_name: str) -> Embeddings:
+    # Dynamic int8 quantization of the Linear layers; weights stay compatible with fp32 vectors.
+    import torch
+    embeddings = HuggingFaceEmbeddings(model_name=model_name)
+    embeddings._client = torch.quantization.quantize_dynamic(embeddings._client, {torch.nn.Linear}, dtype=torch.qint8)
+    return embeddings
+
+def _onnx_embeddings(model_name: str) -> Embeddings:
+    # Requires `optimum[onnxruntime]`; uses the ONNX export shipped with the model repository.
+    return HuggingFaceEmbeddings(model_name=model_name, model_kwargs={"backend": "onnx"})
+
+def _onnx_int8_embeddings(model_name: str) -> Embeddings:
+    return HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={"backend": "onnx", "model_kwargs": {"file_name": "onnx/model_quint8_avx2.onnx"}}
+    )
+
+# Embedding backends selectable by name. Every backend must produce vectors compatible
+# with the "torch" one so an index built with one can be queried with another.
+EMBEDDING_BACKENDS: Dict[str, Callable[[str], Embeddings]] = {
+    "torch": _torch_embeddings,
+    "torch-int8": _torch_int8_embeddings,
+    "onnx": _onnx_embeddings,
+    "onnx-int8": _onnx_int8_embeddings,
+}
+
+def create_embeddings(model_name: str, backend: str = "torch") -> Embeddings:
+    try:
+        factory = EMBEDDING_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown embedding backend '{backend}'. Choose from: {', '.join(EMBEDDING_BACKENDS)}")
+    return factory(model_name)
+
+def apply_search_params(index, search_params: str = ""):
+    """Apply FAISS search-time tuning such as "efSearch=64" (HNSW) or "nprobe=16" (IVF)."""
+    if search_params:
+        faiss.ParameterSpace().set_index_parameters(index, search_params)
+
+def therapy_type_key(therapy_type) -> str:
+    """Partition key of a TherapyType or its name: "dbt", "cbt", ... "general"."""
+    return (getattr(therapy_type, "name", therapy_type) or GLOBAL_PARTITION).lower()
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = RRF_K) -> List[str]:
+    """Merge ranked id lists by summing 1 / (k + rank); ids found by several rankers rise to the top."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def _join_overlapping(first: str, second: str, max_overlap: int) -> str:
+    """Concatenate two consecutive chunks, keeping the text they overlap on only once."""
+    for size in range(min(len(first), len(second), max_overlap), 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first}\n{second}"
+
+def merge_adjacent_chunks(docs: List[Document], max_overlap: int = 400) -> List[Document]:
+    """
+    Join retrieved chunks that are neighbours in the same PDF into a single
+    passage, so the splitter's chunk_overlap is not sent to the LLM twice.
+    Passages keep the rank of their best chunk; chunk_span records which
+    chunks a passage covers.
+    """
+    merged: List[Document] = []
+    for doc in docs:
+        source, index = doc.metadata.get('source'), doc.metadata.get('chunk_id')
+        for i, passage in enumerate(merged):
+            if index is None or passage.metadata.get('source') != source:
+                continue
+            first, last = passage.metadata['chunk_span']
+            if first <= index <= last:
+                break
+            if index == last + 1:
+                text, span = _join_overlapping(passage.page_content, doc.page_content, max_overlap), (first, index)
+            elif index == first - 1:
+                text, span = _join_overlapping(doc.page_content, passage.page_content, max_overlap), (index, last)
+            else:
+                continue
+            merged[i] = Document(page_content=text, metadata={**passage.metadata, 'chunk_span': span})
+            break
+        else:
+            merged.append(Document(page_content=doc.page_content, metadata={**doc.metadata, 'chunk_span': (index, index)}))
+    return merged
+
+def create_faiss_index(dimension: int, index_spec: str = "Flat", search_params: str = ""):
+    """
+    Build an empty FAISS index from an index_factory string, e.g. "Flat"
+    (exact), "HNSW32" (graph) or "IVF256,PQ48" (inverted lists with product
+    quantization, needs training).
+    """
+    index = faiss.index_factory(dimension, index_spec)
+    apply_search_params(index, search_params)
+    return index
 
 class PDFVectorStore:
-    def __init__(self, folder_path: str = "./pdf/", vector_store_path: str = "./vector_store/"):
+    vector_store = _loaded_attribute("vector_store")
+    chunk_store = _loaded_attribute("chunk_store")
+    index_version = _loaded_attribute("index_version")
+    manifest = _loaded_attribute("manifest")
+    loaded_path = _loaded_attribute("loaded_path")
+
+    def __init__(self, folder_path: str = "./pdf/", vector_store_path: str = "./vector_store/",
+                 embedding_model_name: str = "sentence-transformers/all-MiniLM-L6-v2", cache=None,
+                 extraction_workers: Optional[int] = None, extraction_timeout: float = 300.0,
+                 embedding_batch_size: int = 64, embedding_backend: str = "torch",
+                 index_spec: str = "Flat", search_params: str = "", index_train_size: int = 20000,
+                 mmap_index: bool = False, read_only: bool = False, retrieval_mode: str = "vector",
+                 hybrid_candidates: int = 20, document_types: Optional[Dict[str, str]] = None,
+                 classify_documents: bool = True, max_resident_partitions: int = 4, reranker=None,
+                 dedup_threshold: Optional[float] = 0.9, mmr_lambda: Optional[float] = 0.7, mmr_candidates: int = 10):
         self.folder_path = folder_path
         self.vector_store_path = vector_store_path
         self.documents: List[PDFDocument] = []
-        self.vector_store: Optional[FAISS] = None
+        # The index, chunk store, version, manifest and partitions, swapped as one by load_vector_store.
+        self.loaded = LoadedIndex()
+        # Optional RetrievalCache (see therapy/retrieval_cache.py).
+        self.cache = cache
+        self.extraction_workers = extraction_workers or os.cpu_count() or 1
+        self.extraction_timeout = extraction_timeout
+        self.embedding_batch_size = embedding_batch_size
+        self.index_spec = index_spec
+        self.search_params = search_params
+        # Vectors collected to train indexes that need it (IVF/PQ) before anything is added.
+        self.index_train_size = index_train_size
+        self._train_buffer: List[Tuple[str, List[float], Dict, str]] = []
+        # Serving processes open the published index read-only (optionally memory-mapped, with chunk
+        # texts read lazily from SQLite); builders need a private, writable copy.
+        self.mmap_index = mmap_index
+        self.read_only = read_only or mmap_index
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {retrieval_mode!r}; expected one of {', '.join(RETRIEVAL_MODES)}")
+        self.retrieval_mode = retrieval_mode
+        # Candidates taken from each ranking before fusion in hybrid mode.
+        self.hybrid_candidates = hybrid_candidates
+        # Filename glob -> TherapyType name, e.g. {"*dbt*.pdf": "DBT"}. PDFs matching no pattern
+        # are classified from their text when classify_documents is set, else tagged "general".
+        self.document_types = {}
+        for pattern, therapy_type in (document_types or {}).items():
+            if therapy_type.upper() not in TherapyType.__members__:
+                raise ValueError(f"Unknown therapy type {therapy_type!r} for documents matching {pattern!r}")
+            self.document_types[pattern.lower()] = therapy_type_key(therapy_type)
+        self.classify_documents = classify_documents
+        # Partition sub-indexes are read on first use; the least recently used are dropped past this many.
+        self.max_resident_partitions = max_resident_partitions
+        self._partitions_lock = threading.Lock()
+        # Optional CrossEncoderReranker (see therapy/reranker.py) applied to over-fetched candidates.
+        self.reranker = reranker
+        # Near-duplicate chunks (estimated Jaccard >= dedup_threshold) are dropped at ingest; None disables it.
+        self.deduplicator = MinHashDeduplicator(threshold=dedup_threshold) if dedup_threshold else None
+        # Without a reranker, the final chunks are picked from mmr_candidates by maximal marginal
+        # relevance (1.0 = pure relevance, lower favours diversity); None disables it.
+        self.mmr_lambda = mmr_lambda
+        self.mmr_candidates = mmr_candidates
         
-        self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        self.embedding_model_name = embedding_model_name
+        self.embedding_backend = embedding_backend
+        self.embeddings = create_embeddings(embedding_model_name, embedding_backend)
         
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
@@ -39,106 +314,393 @@ class PDFVectorStore:
         os.makedirs(folder_path, exist_ok=True)
         os.makedirs(vector_store_path, exist_ok=True)
         
-    def load_pdf_files(self) -> List[PDFDocument]:
-        pdf_files = [f for f in os.listdir(self.folder_path) if f.endswith('.pdf')]
+    def list_pdf_files(self) -> List[str]:
+        return sorted(f for f in os.listdir(self.folder_path) if f.endswith('.pdf'))
+
+    def load_pdf_files(self, filenames: Optional[List[str]] = None) -> List[PDFDocument]:
+        loaded = list(self.iter_pdf_documents(filenames))
+        self.documents.extend(loaded)
+        return loaded
+
+    def iter_pdf_documents(self, filenames: Optional[List[str]] = None) -> Iterator[PDFDocument]:
+        """Yield extracted PDFs one at a time without keeping them on the instance."""
+        pdf_files = self.list_pdf_files() if filenames is None else filenames
         if not pdf_files:
             logger.warning(f"No PDF files found in {self.folder_path}")
-            return []
+            return
         
-        for pdf_file in pdf_files:
-            file_path = os.path.join(self.folder_path, pdf_file)
-            try:
-                content = self._extract_with_pdfplumber(file_path)
-                if not content:
-                    content = self._extract_with_pypdf2(file_path)
-                if content:
-                    with open(file_path, 'rb') as file:
-                        pdf_reader = PyPDF2.PdfReader(file)
-                        page_count = len(pdf_reader.pages)
-                    doc = PDFDocument(
-                        filename=pdf_file,
-                        content=content,
-                        metadata={'source': pdf_file, 'therapy_type': 'general'},
-                        page_count=page_count
-                    )
-                    self.documents.append(doc)
-                    logger.info(f"Successfully loaded: {pdf_file} ({page_count} pages)")
-                else:
-                    logger.error(f"Could not extract content from: {pdf_file}")
-            except Exception as e:
-                logger.error(f"Error loading {pdf_file}: {str(e)}")
-        return self.documents
+        for pdf_file, result in self._extract_all(pdf_files):
+            if isinstance(result, Exception):
+                logger.error(f"Error loading {pdf_file}: {str(result)}")
+                continue
+            content, page_count, file_hash = result
+            if content:
+                logger.info(f"Successfully loaded: {pdf_file} ({page_count} pages)")
+                yield PDFDocument(
+                    filename=pdf_file,
+                    content=content,
+                    metadata={'source': pdf_file, 'therapy_type': self.therapy_type_for(pdf_file, content)},
+                    page_count=page_count,
+                    file_hash=file_hash
+                )
+            else:
+                logger.error(f"Could not extract content from: {pdf_file}")
+
+    def therapy_type_for(self, filename: str, content: str) -> str:
+        for pattern, therapy_type in self.document_types.items():
+            if fnmatch.fnmatch(filename.lower(), pattern):
+                return therapy_type
+        if self.classify_documents:
+            return therapy_type_key(PromptManager().classify_document(content))
+        return GLOBAL_PARTITION
 
-    def _extract_with_pdfplumber(self, file_path: str) -> str:
+    def _extract_all(self, pdf_files: List[str]):
+        """
+        Yield (filename, (content, page_count, sha256) or exception) in input
+        order. Files are parsed in a process pool so a cold build uses every
+        core; a failing or hung file only affects its own result. At most
+        two files per worker are in flight, so extracted text does not pile
+        up faster than the embedding stage consumes it. The timeout counts
+        from when the build starts waiting on that file.
+        """
+        paths = [os.path.join(self.folder_path, f) for f in pdf_files]
+        # Celery prefork workers are daemonic and may not start child processes.
+        if self.extraction_workers <= 1 or len(paths) == 1 or multiprocessing.current_process().daemon:
+            for pdf_file, path in zip(pdf_files, paths):
+                try:
+                    yield pdf_file, extract_pdf(path)
+                except Exception as e:
+                    yield pdf_file, e
+            return
+
+        workers = min(self.extraction_workers, len(paths))
+        executor = ProcessPoolExecutor(max_workers=workers)
+        pending = iter(zip(pdf_files, paths))
+        in_flight = deque()
+        timed_out = False
         try:
-            with PDF.open(file_path) as pdf:
-                text = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                return text.strip()
-        except Exception as e:
-            logger.warning(f"pdfplumber extraction failed: {e}")
-            return ""
+            for pdf_file, path in islice(pending, 2 * workers):
+                in_flight.append((pdf_file, executor.submit(extract_pdf, path)))
+            while in_flight:
+                pdf_file, future = in_flight.popleft()
+                try:
+                    result = future.result(timeout=self.extraction_timeout)
+                except FuturesTimeoutError:
+                    timed_out = True
+                    result = TimeoutError(f"extraction exceeded {self.extraction_timeout}s")
+                except Exception as e:
+                    result = e
+                for next_file, next_path in islice(pending, 1):
+                    in_flight.append((next_file, executor.submit(extract_pdf, next_path)))
+                yield pdf_file, result
+        finally:
+            if timed_out:
+                # A hung parser would otherwise keep its worker (and interpreter shutdown) busy.
+                for process in list(executor._processes.values()):
+                    process.terminate()
+            executor.shutdown(wait=not timed_out, cancel_futures=True)
+
+    def _chunk_document(self, pdf_doc: PDFDocument):
+        """
+        Split one PDF into Documents with ids that are stable for the same
+        file name and content. Returns the kept documents, their ids and the
+        ids of already indexed chunks that dropped chunks duplicated.
+        """
+        chunks = self.text_splitter.split_text(pdf_doc.content)
+        docs = [
+            Document(
+                page_content=chunk,
+                metadata={**pdf_doc.metadata, 'chunk_id': i, 'total_chunks': len(chunks)}
+            )
+            for i, chunk in enumerate(chunks)
+        ]
+        prefix = chunk_id_prefix(pdf_doc.filename, pdf_doc.file_hash)
+        ids = [f"{prefix}{i}" for i in range(len(chunks))]
+        if self.deduplicator is None:
+            return docs, ids, []
+        kept, duplicate_of = [], set()
+        for doc, chunk_id in zip(docs, ids):
+            original_id = self.deduplicator.check_and_add(chunk_id, doc.page_content)
+            if original_id is None:
+                kept.append((doc, chunk_id))
+            else:
+                duplicate_of.add(original_id)
+        if len(kept) < len(docs):
+            logger.info(f"Dropped {len(docs) - len(kept)} near-duplicate chunks from {pdf_doc.filename}")
+        return [doc for doc, _ in kept], [chunk_id for _, chunk_id in kept], sorted(duplicate_of)
+
+    def reset_deduplicator(self, vector_store: Optional[FAISS] = None):
+        """
+        Start near-duplicate detection over, seeded with the chunks already in
+        vector_store. Builders call this once stale chunks are deleted. The
+        manifest records which kept chunks each PDF's dropped chunks
+        duplicated (duplicate_of), so the builder re-ingests that PDF when
+        the kept copy goes away.
+        """
+        if self.deduplicator is None:
+            return
+        self.deduplicator.clear()
+        if vector_store is None:
+            return
+        for chunk_id in vector_store.index_to_docstore_id.values():
+            doc = vector_store.docstore.search(chunk_id)
+            if isinstance(doc, Document):
+                self.deduplicator.add(chunk_id, self.deduplicator.signature(doc.page_content))
+
+    def _manifest_entry(self, pdf_doc: PDFDocument, chunk_ids: List[str], duplicate_of: List[str]) -> Dict:
+        return {'sha256': pdf_doc.file_hash, 'page_count': pdf_doc.page_count, 'chunk_ids': chunk_ids,
+                'duplicate_of': duplicate_of, 'therapy_type': pdf_doc.metadata.get('therapy_type', GLOBAL_PARTITION)}
+
+    @property
+    def supports_deletion(self) -> bool:
+        """
+        Whether stale vectors can be removed in place. FAISS.delete renumbers
+        index_to_docstore_id compactly and later adds number from ntotal, which
+        only matches indexes whose remove_ids compacts the remaining rows: flat
+        code storage (Flat, SQ, PQ, LSH), optionally behind a pre-transform.
+        IVF lists keep their old labels and HNSW graphs cannot remove at all,
+        so changed or removed PDFs need a full rebuild for those.
+        """
+        components = [component.strip().upper() for component in self.index_spec.split(",")]
+        if any(component.startswith(("IVF", "IMI", "HNSW", "NSG")) for component in components):
+            return False
+        return bool(_COMPACTING_STORAGE.fullmatch(components[-1]))
+
+    def _new_vector_store(self, dimension: int) -> FAISS:
+        return FAISS(
+            embedding_function=self.embeddings,
+            index=create_faiss_index(dimension, self.index_spec, self.search_params),
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={}
+        )
 
-    def _extract_with_pypdf2(self, file_path: str) -> str:
+    def _embed_into_index(self, chunks: Iterable[Tuple[Document, str]], vector_store: Optional[FAISS] = None,
+                          on_batch: Optional[Callable[[FAISS, List[str]], None]] = None, flush: bool = True) -> Optional[FAISS]:
+        """
+        Embed chunks in fixed-size batches and add each batch to the index
+        before pulling the next one, so only one batch of vectors is held at
+        a time regardless of corpus size. on_batch is called after every
+        batch (used for checkpointing). Indexes that need training buffer up
+        to index_train_size vectors first; flush=False keeps a short buffer
+        pending for the next call instead of training on it.
+        """
+        chunks = iter(chunks)
+        while True:
+            batch = list(islice(chunks, self.embedding_batch_size))
+            if not batch:
+                break
+            texts = [doc.page_content for doc, _ in batch]
+            vectors = self.embeddings.embed_documents(texts)
+            metadatas = [doc.metadata for doc, _ in batch]
+            ids = [chunk_id for _, chunk_id in batch]
+            if vector_store is None:
+                vector_store = self._new_vector_store(len(vectors[0]))
+            if not vector_store.index.is_trained:
+                self._train_buffer.extend(zip(texts, vectors, metadatas, ids))
+                if len(self._train_buffer) >= self.index_train_size:
+                    self._train_and_flush(vector_store, on_batch)
+                continue
+            vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+            if on_batch:
+                on_batch(vector_store, ids)
+        if flush and self._train_buffer:
+            self._train_and_flush(vector_store, on_batch)
+        return vector_store
+
+    def _train_and_flush(self, vector_store: FAISS, on_batch=None):
+        buffered, self._train_buffer = self._train_buffer, []
+        texts, vectors, metadatas, ids = (list(column) for column in zip(*buffered))
+        if not vector_store.index.is_trained:
+            vector_store.index.train(np.array(vectors, dtype=np.float32))
+            logger.info(f"Trained {self.index_spec} index on {len(vectors)} vectors.")
+        vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        if on_batch:
+            on_batch(vector_store, ids)
+
+    def build_vector_store(self, incremental: bool = True) -> FAISS:
+        """
+        Build the index, or bring the published one up to date, and publish
+        it. Kept for callers of the old API; the work is done by
+        KnowledgeBaseBuilder, the only build path.
+        """
+        # Imported here: kb_builder imports this module.
+        from .kb_builder import KnowledgeBaseBuilder
+        KnowledgeBaseBuilder(self).build(resume=False, full=not incremental)
+        return self.vector_store
+
+    def _read_manifest(self, path: str) -> Dict:
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                return text.strip()
-        except Exception as e:
-            logger.warning(f"PyPDF2 extraction failed: {e}")
-            return ""
+            with open(os.path.join(path, MANIFEST_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
 
-    def build_vector_store(self) -> FAISS:
+    def published_version(self) -> Optional[str]:
+        """Version named by the CURRENT pointer, or None for an unversioned (legacy) layout."""
         try:
-            if not self.documents:
-                self.load_pdf_files()
-            if not self.documents:
-                raise ValueError("No documents loaded. Please add PDF files to the folder.")
-            
-            langchain_docs = []
-            for pdf_doc in self.documents:
-                chunks = self.text_splitter.split_text(pdf_doc.content)
-                for i, chunk in enumerate(chunks):
-                    doc = Document(
-                        page_content=chunk,
-                        metadata={**pdf_doc.metadata, 'chunk_id': i, 'total_chunks': len(chunks)}
-                    )
-                    langchain_docs.append(doc)
-            
-            self.vector_store = FAISS.from_documents(documents=langchain_docs, embedding=self.embeddings)
-            self.save_vector_store()
-            logger.info("Vector store successfully built and saved.")
-            return self.vector_store
-        except Exception as e:
-            logger.error(f"Failed to build vector store: {e}")
-            raise
+            with open(os.path.join(self.vector_store_path, CURRENT_VERSION_FILE)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def current_index_path(self) -> str:
+        version = self.published_version()
+        if version:
+            return os.path.join(self.vector_store_path, VERSIONS_DIR, version)
+        return self.vector_store_path
 
     def save_vector_store(self, path: str = None):
+        """Write the index to path, or publish it as a new version when no path is given."""
+        if path is None:
+            return self.publish_vector_store()
         try:
-            path = path or self.vector_store_path
             if self.vector_store:
-                self.vector_store.save_local(path)
+                self.write_vector_store(self.vector_store, path)
+                partitions = self.write_partitions(self.vector_store, path)
+                with open(os.path.join(path, INDEX_VERSION_FILE), 'w') as f:
+                    f.write(self.index_version or uuid.uuid4().hex)
+                if self.manifest:
+                    with open(os.path.join(path, MANIFEST_FILE), 'w') as f:
+                        json.dump({**self.manifest, 'partitions': partitions}, f)
                 logger.info(f"Vector store saved to {path}")
         except Exception as e:
             logger.error(f"Failed to save vector store: {e}")
             raise
 
+    def write_vector_store(self, vector_store: FAISS, path: str):
+        """Persist the FAISS index and its chunks (as SQLite, not a pickle) into path."""
+        os.makedirs(path, exist_ok=True)
+        faiss.write_index(vector_store.index, os.path.join(path, "index.faiss"))
+        write_chunk_store(os.path.join(path, CHUNKS_FILE), vector_store.docstore, vector_store.index_to_docstore_id)
+
+    def write_partitions(self, vector_store: FAISS, path: str) -> Dict[str, int]:
+        """
+        Write one exact (flat) sub-index per therapy type next to the global
+        index, holding copies of that type's vectors under their global row
+        positions. Returns the number of chunks per partition.
+        """
+        positions: Dict[str, List[int]] = {}
+        for position, chunk_id in vector_store.index_to_docstore_id.items():
+            doc = vector_store.docstore.search(chunk_id)
+            therapy_type = doc.metadata.get('therapy_type', GLOBAL_PARTITION) if isinstance(doc, Document) else GLOBAL_PARTITION
+            if therapy_type != GLOBAL_PARTITION:
+                positions.setdefault(therapy_type, []).append(position)
+        if not positions:
+            return {}
+
+        index = vector_store.index
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            # IVF indexes can only reconstruct vectors by id through a direct map (PQ codes are decoded lossily).
+            ivf.make_direct_map()
+        partitions_path = os.path.join(path, PARTITIONS_DIR)
+        os.makedirs(partitions_path, exist_ok=True)
+        for therapy_type, ids in positions.items():
+            ids_array = np.array(sorted(ids), dtype=np.int64)
+            vectors = np.vstack([index.reconstruct(int(i)) for i in ids_array]).astype(np.float32)
+            partition = faiss.IndexIDMap2(faiss.IndexFlat(index.d, index.metric_type))
+            partition.add_with_ids(vectors, ids_array)
+            faiss.write_index(partition, os.path.join(partitions_path, f"{therapy_type}.faiss"))
+        return {therapy_type: len(ids) for therapy_type, ids in positions.items()}
+
+    def read_vector_store(self, path: str, allow_dangerous_deserialization: bool = False) -> FAISS:
+        """
+        Open a persisted index. Read-only stores resolve chunk texts lazily
+        from chunks.sqlite3; writable ones copy them into an in-memory
+        docstore. The pickled docstore of indexes written before the SQLite
+        chunk store is only read with allow_dangerous_deserialization.
+        """
+        vector_store, self.chunk_store = self._open_vector_store(path, allow_dangerous_deserialization)
+        return vector_store
+
+    def _open_vector_store(self, path: str, allow_dangerous_deserialization: bool = False
+                           ) -> Tuple[FAISS, Optional[SQLiteChunkStore]]:
+        index = self._read_faiss_index(path)
+        chunks_path = os.path.join(path, CHUNKS_FILE)
+        chunk_store = None
+        if os.path.exists(chunks_path):
+            chunk_store = SQLiteChunkStore(chunks_path)
+            if self.read_only:
+                docstore, index_to_docstore_id = chunk_store, SQLiteIndexMapping(chunk_store)
+            else:
+                docstore, index_to_docstore_id = chunk_store.load_in_memory()
+        elif allow_dangerous_deserialization:
+            with open(os.path.join(path, "index.pkl"), 'rb') as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+        else:
+            raise ValueError(f"No {CHUNKS_FILE} in {path}; rebuild the knowledge base to replace the legacy pickle.")
+        vector_store = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id
+        )
+        return vector_store, chunk_store
+
+    def publish_vector_store(self):
+        """
+        Write the index into a fresh versions/<version>/ directory and then
+        switch CURRENT to it with an atomic rename, so readers only ever see
+        complete artifacts.
+        """
+        if not self.vector_store:
+            return
+        self.index_version = self.index_version or uuid.uuid4().hex
+        versions_path = os.path.join(self.vector_store_path, VERSIONS_DIR)
+        final_path = os.path.join(versions_path, self.index_version)
+        tmp_path = f"{final_path}.tmp-{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        self.save_vector_store(tmp_path)
+        if os.path.exists(final_path):
+            shutil.rmtree(final_path)
+        os.rename(tmp_path, final_path)
+
+        pointer_tmp = os.path.join(self.vector_store_path, f"{CURRENT_VERSION_FILE}.tmp-{os.getpid()}")
+        with open(pointer_tmp, 'w') as f:
+            f.write(self.index_version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, os.path.join(self.vector_store_path, CURRENT_VERSION_FILE))
+        logger.info(f"Published vector store version {self.index_version}")
+        self._prune_versions()
+
+    def _prune_versions(self):
+        versions_path = os.path.join(self.vector_store_path, VERSIONS_DIR)
+        versions = sorted(
+            (entry for entry in os.scandir(versions_path) if entry.is_dir() and '.tmp-' not in entry.name),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        for entry in versions[KEEP_VERSIONS:]:
+            if entry.name != self.index_version:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _read_faiss_index(self, path: str, filename: str = "index.faiss"):
+        """
+        Read index.faiss (or a partition file) either into private memory or,
+        with mmap_index, as a read-only memory map so every worker on the node
+        shares the same page-cache pages. Published versions are never
+        modified in place, which is what makes mapping them safe.
+        """
+        index_file = os.path.join(path, filename)
+        if not self.mmap_index:
+            return faiss.read_index(index_file)
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+        return faiss.read_index(index_file, flags)
+
     def load_vector_store(self, path: str = None, allow_dangerous_deserialization: bool = False):
-        path = path or self.vector_store_path
+        path = path or self.current_index_path()
         if os.path.exists(path):
             try:
-                self.vector_store = FAISS.load_local(
-                    path,
-                    self.embeddings,
-                    allow_dangerous_deserialization=allow_dangerous_deserialization
+                vector_store, chunk_store = self._open_vector_store(path, allow_dangerous_deserialization)
+                apply_search_params(vector_store.index, self.search_params)
+                # One assignment, so searches in flight keep the previous version whole.
+                self.loaded = LoadedIndex(
+                    vector_store=vector_store,
+                    chunk_store=chunk_store,
+                    index_version=self._read_index_version(path),
+                    manifest=self._read_manifest(path),
+                    loaded_path=path
                 )
                 logger.info(f"Vector store loaded from {path}")
                 return True
@@ -147,15 +709,192 @@ class PDFVectorStore:
                 return False
         return False
 
+    def _read_index_version(self, path: str) -> str:
+        try:
+            with open(os.path.join(path, INDEX_VERSION_FILE)) as f:
+                return f.read().strip()
+        except OSError:
+            # Index saved before versioning existed: derive a version from the index file itself.
+            stat = os.stat(os.path.join(path, "index.faiss"))
+            return f"{int(stat.st_mtime)}-{stat.st_size}"
+
     def get_stats(self):
+        files = self.manifest.get('files', {})
+        if files:
+            return {
+                "total_pdfs": len(files),
+                "total_chunks": sum(len(entry['chunk_ids']) for entry in files.values())
+            }
         return {
             "total_pdfs": len(self.documents),
             "total_chunks": sum(len(self.text_splitter.split_text(doc.content)) for doc in self.documents)
         }
     
-    def retrieve_pdf_context(self, query: str, top_k: int = 3) -> str:
+    def embed_query(self, query: str) -> List[float]:
+        if self.cache is None:
+            return self.embeddings.embed_query(query)
+        normalized = self.cache.normalize(query)
+        embedding = self.cache.get_embedding(normalized)
+        if embedding is None:
+            started = time.perf_counter()
+            embedding = self.embeddings.embed_query(normalized)
+            self.cache.set_embedding(normalized, embedding, time.perf_counter() - started)
+        return embedding
+
+    def get_partition(self, therapy_type: str, loaded: Optional[LoadedIndex] = None):
+        """Sub-index of one therapy type, or None when the loaded version has no such partition."""
+        loaded = loaded or self.loaded
+        partitions = loaded.partitions
+        with self._partitions_lock:
+            if therapy_type in partitions:
+                partitions.move_to_end(therapy_type)
+                return partitions[therapy_type]
+        partition = None
+        partitions_path = os.path.join(loaded.loaded_path, PARTITIONS_DIR) if loaded.loaded_path else None
+        if partitions_path and os.path.exists(os.path.join(partitions_path, f"{therapy_type}.faiss")):
+            partition = self._read_faiss_index(partitions_path, f"{therapy_type}.faiss")
+        with self._partitions_lock:
+            partitions[therapy_type] = partition
+            while len(partitions) > self.max_resident_partitions:
+                partitions.popitem(last=False)
+        return partition
+
+    def _search_chunk_ids(self, embedding: List[float], top_k: int, index=None,
+                          loaded: Optional[LoadedIndex] = None) -> List[str]:
+        vector_store = (loaded or self.loaded).vector_store
+        index = index if index is not None else vector_store.index
+        _, indices = index.search(np.array([embedding], dtype=np.float32), top_k)
+        return [vector_store.index_to_docstore_id[i] for i in indices[0] if i != -1]
+
+    def _search_bm25_ids(self, query: str, top_k: int, therapy_type: Optional[str], loaded: LoadedIndex) -> List[str]:
+        if loaded.chunk_store is None:
+            return []
+        return loaded.chunk_store.search_bm25(query, top_k, therapy_type)
+
+    def _ranked_chunk_ids(self, loaded: LoadedIndex, query: str, top_k: int, mode: str, index=None,
+                          therapy_type: Optional[str] = None) -> List[str]:
+        embedding = self.embed_query(query)
+        if mode == "hybrid":
+            candidates = max(top_k, self.hybrid_candidates)
+            vector_ids = self._search_chunk_ids(embedding, candidates, index, loaded)
+            bm25_ids = self._search_bm25_ids(query, candidates, therapy_type, loaded)
+            return reciprocal_rank_fusion([vector_ids, bm25_ids])[:top_k]
+        return self._search_chunk_ids(embedding, top_k, index, loaded)
+
+    def search_chunk_ids(self, query: str, top_k: int, mode: Optional[str] = None,
+                         therapy_type: Optional[str] = None, loaded: Optional[LoadedIndex] = None) -> List[str]:
+        """
+        Ranked chunk ids for query, vector-only or fused with BM25 depending
+        on mode. With a therapy_type that has a partition, only that
+        partition is searched; the global index fills whatever it cannot.
+        """
+        mode = mode or self.retrieval_mode
+        loaded = loaded or self.loaded
+        partition = (self.get_partition(therapy_type, loaded)
+                     if therapy_type and therapy_type != GLOBAL_PARTITION else None)
+        if partition is None:
+            return self._ranked_chunk_ids(loaded, query, top_k, mode)
+        chunk_ids = self._ranked_chunk_ids(loaded, query, top_k, mode, partition, therapy_type)
+        if len(chunk_ids) < top_k:
+            chunk_ids += [i for i in self._ranked_chunk_ids(loaded, query, top_k, mode) if i not in chunk_ids]
+        return chunk_ids[:top_k]
+
+    def _get_documents(self, loaded: LoadedIndex, chunk_ids: List[str]) -> List[Tuple[str, Document]]:
+        found = ((chunk_id, loaded.vector_store.docstore.search(chunk_id)) for chunk_id in chunk_ids)
+        return [(chunk_id, doc) for chunk_id, doc in found if isinstance(doc, Document)]
+
+    def similarity_search(self, query: str, top_k: int = 3, mode: Optional[str] = None,
+                          therapy_type=None) -> List[Document]:
+        """
+        Top chunks for query. With a reranker, `reranker.candidates` chunks
+        are fetched and re-scored instead, keeping at most top_k; when the
+        time budget is already spent the first-stage order is used as is.
+        """
+        started = time.perf_counter()
+        # Captured once: a reload meanwhile must not change the index under this search.
+        loaded = self.loaded
+        mode = mode or self.retrieval_mode
+        partition = therapy_type_key(therapy_type) if therapy_type else GLOBAL_PARTITION
+        fetch_k = max(top_k, self.reranker.candidates if self.reranker else 0,
+                      self.mmr_candidates if self.mmr_lambda is not None else 0)
+        if self.cache is None:
+            found = self._get_documents(loaded, self.search_chunk_ids(query, fetch_k, mode, partition, loaded))
+            selected, _ = self._select(loaded, query, found, top_k, started)
+            return [doc for _, doc in selected]
+
+        normalized = self.cache.normalize(query)
+        # Rankings differ per mode and partition, so they must not share cached results.
+        cache_version = loaded.index_version
+        if mode != "vector":
+            cache_version = f"{cache_version}:{mode}"
+        if partition != GLOBAL_PARTITION:
+            cache_version = f"{cache_version}:{partition}"
+        if self.reranker:
+            reranked_ids = self.cache.get_results(normalized, f"{cache_version}:rerank", top_k)
+            if reranked_ids is not None:
+                return [doc for _, doc in self._get_documents(loaded, reranked_ids)]
+
+        chunk_ids = self.cache.get_results(normalized, cache_version, fetch_k)
+        if chunk_ids is None:
+            chunk_ids = self.search_chunk_ids(query, fetch_k, mode, partition, loaded)
+            self.cache.set_results(normalized, cache_version, fetch_k, chunk_ids)
+        selected, reranked = self._select(loaded, query, self._get_documents(loaded, chunk_ids), top_k, started)
+        if reranked:
+            # Only completed re-rankings are cached, so a skipped one is retried on the next request.
+            self.cache.set_results(normalized, f"{cache_version}:rerank", top_k, [chunk_id for chunk_id, _ in selected])
+        return [doc for _, doc in selected]
+
+    def _select(self, loaded: LoadedIndex, query: str, found: List[Tuple[str, Document]], top_k: int,
+                started: float) -> Tuple[List[Tuple[str, Document]], bool]:
+        """
+        Pick the final top_k of the over-fetched candidates: cross-encoder
+        order when re-ranking fits the budget, else maximal marginal
+        relevance, else first-stage order. The flag is True when re-ranked.
+        """
+        reranked = self._rerank(query, found, started)
+        if reranked is not None:
+            return reranked[:top_k], True
+        if self.mmr_lambda is not None and len(found) > top_k:
+            diversified = self._mmr(loaded, query, found, top_k)
+            if diversified is not None:
+                return diversified, False
+        return found[:top_k], False
+
+    def _mmr(self, loaded: LoadedIndex, query: str, found: List[Tuple[str, Document]],
+             top_k: int) -> Optional[List[Tuple[str, Document]]]:
+        vectors = self._candidate_vectors(loaded, [chunk_id for chunk_id, _ in found])
+        if vectors is None:
+            return None
+        query_vector = np.array(self.embed_query(query), dtype=np.float32)
+        selected = maximal_marginal_relevance(query_vector, vectors, lambda_mult=self.mmr_lambda, k=top_k)
+        return [found[i] for i in selected]
+
+    def _candidate_vectors(self, loaded: LoadedIndex, chunk_ids: List[str]) -> Optional[np.ndarray]:
+        """Stored vectors of chunk_ids, or None when the index cannot reconstruct them (IVF without a direct map)."""
+        mapping = loaded.vector_store.index_to_docstore_id
+        if isinstance(mapping, SQLiteIndexMapping):
+            positions = mapping.chunk_store.positions_of(chunk_ids)
+        else:
+            reverse = {chunk_id: position for position, chunk_id in mapping.items()}
+            positions = [reverse[chunk_id] for chunk_id in chunk_ids]
+        try:
+            return np.vstack([loaded.vector_store.index.reconstruct(int(position)) for position in positions])
+        except RuntimeError:
+            return None
+
+    def _rerank(self, query: str, found: List[Tuple[str, Document]], started: float) -> Optional[List[Tuple[str, Document]]]:
+        """found re-ordered (and cut to reranker.keep) by the reranker; None when there is none or it was skipped."""
+        if self.reranker is None or len(found) <= 1:
+            return None
+        ranked = self.reranker.rerank(query, [doc.page_content for _, doc in found], started)
+        if ranked is None:
+            return None
+        return [found[i] for i, _ in ranked]
+
+    def retrieve_pdf_context(self, query: str, top_k: int = 3, mode: Optional[str] = None,
+                             therapy_type=None) -> str:
         if not self.vector_store:
             return ""
-        results = self.vector_store.similarity_search(query, k=top_k)
-        combined_text = "\n---\n".join([doc.page_content for doc in results])
+        results = merge_adjacent_chunks(self.similarity_search(query, top_k, mode, therapy_type))
+        combined_text = CONTEXT_SEPARATOR.join([doc.page_content for doc in results])
         return combined_text
\ No newline at end of file
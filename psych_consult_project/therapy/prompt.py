@@ -1,6 +1,31 @@
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Tuple
+from dataclasses import asdict, dataclass
 from enum import Enum
+from functools import lru_cache
 import re
+import tiktoken
+
+# Approximate per-message framing overhead of the chat completions format.
+MESSAGE_TOKEN_OVERHEAD = 4
+# Separates retrieved passages inside pdf_context.
+CONTEXT_SEPARATOR = "\n---\n"
+# A sentence with its closing punctuation and trailing whitespace (or the unterminated rest of the text).
+_SENTENCE = re.compile(r'.+?(?:[.!?]+["\')\]]*(?=\s|$)|$)\s*', re.DOTALL)
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+def count_tokens(text: str, model: str = "gpt-4.1-mini") -> int:
+    return len(_get_encoding(model).encode(text or "", disallowed_special=()))
+
+def truncate_tokens(text: str, token_budget: int, model: str = "gpt-4.1-mini") -> str:
+    """First token_budget tokens of text."""
+    encoding = _get_encoding(model)
+    return encoding.decode(encoding.encode(text or "", disallowed_special=())[:max(token_budget, 0)])
 
 class TherapyType(Enum):
     CBT = "Cognitive Behavioral Therapy"
@@ -26,31 +51,167 @@ class ConversationStyle(Enum):
     CURIOUS = "curious"
     SOLUTION_FOCUSED = "solution-focused"
 
+# Weighted keywords per therapy type. Keywords match whole words, case-insensitively unless written
+# in capitals (acronyms such as "ACT" that are also common words); a trailing "*" also matches longer
+# words ("depress*" covers "depressed", "depression"). The order of the types breaks ties.
+THERAPY_TYPE_KEYWORDS: Dict[TherapyType, Dict[str, float]] = {
+    TherapyType.CBT: {"cognitive behavioral therapy": 3.0, "cognitive behavioural therapy": 3.0, "cbt": 3.0,
+                      "cognitive distortion*": 2.0, "thought record*": 2.0, "cognitive restructuring": 2.0,
+                      "negative thought*": 1.0},
+    TherapyType.DBT: {"dialectical behavior therapy": 3.0, "dialectical behaviour therapy": 3.0, "dbt": 3.0,
+                      "distress tolerance": 2.0, "tipp": 2.0, "radical acceptance": 2.0, "wise mind": 2.0,
+                      "emotion regulation": 1.0},
+    TherapyType.ACT: {"acceptance and commitment therapy": 3.0, "ACT": 2.0, "act therapy": 3.0, "defusion": 2.0,
+                      "cognitive defusion": 2.0, "psychological flexibility": 2.0, "values": 0.5},
+    TherapyType.GRIEF: {"grief": 2.0, "griev*": 2.0, "bereave*": 2.0, "loss": 1.0, "mourning": 2.0,
+                        "passed away": 2.0},
+    TherapyType.ANXIETY: {"anxiety": 2.0, "anxious": 2.0, "panic*": 2.0, "worried": 1.0, "worry": 1.0,
+                          "worrying": 1.0, "nervous": 1.0},
+    TherapyType.PARENTING: {"parent*": 2.0, "child": 1.0, "children": 1.0, "childhood": 0.5, "kid": 1.0,
+                            "kids": 1.0, "toddler*": 2.0, "teenager*": 1.0, "family": 0.5},
+    TherapyType.DEPRESSION: {"depress*": 2.0, "sad": 1.0, "sadness": 1.0, "hopeless*": 2.0, "empty": 0.5},
+    TherapyType.TRAUMA: {"trauma": 2.0, "traumatic": 2.0, "traumatized": 2.0, "trauma-informed": 2.0,
+                         "ptsd": 3.0, "flashback*": 2.0},
+}
+
+def _keyword_regex(keyword: str) -> str:
+    pattern = r"\s+".join(re.escape(word) for word in keyword.rstrip("*").split())
+    return rf"{pattern}\w*" if keyword.endswith("*") else pattern
+
+def _trie_regex(keywords: Iterable[str]) -> str:
+    """
+    One regex for many keywords, factored into a character trie so the
+    engine follows a single path per position instead of trying every
+    alternative in turn.
+    """
+    trie: Dict = {}
+    for keyword in keywords:
+        node = trie
+        for char in " ".join(keyword.lower().rstrip("*").split()):
+            node = node.setdefault(char, {})
+        node[""] = "*" if keyword.endswith("*") or node.get("") == "*" else "."
+
+    def build(node: Dict) -> str:
+        branches = [(r"\s+" if char == " " else re.escape(char)) + build(child)
+                    for char, child in sorted(node.items()) if char]
+        end = node.get("")
+        if end == "*":
+            branches.append(r"\w*")
+        elif end and branches:
+            branches.append("")
+        if len(branches) <= 1:
+            return "".join(branches)
+        return "(?:" + "|".join(branches) + ")"
+
+    return build(trie)
+
+class TherapyTypeClassifier:
+    """
+    Scores text against weighted keyword tables with one compiled regex:
+    a single left-to-right scan finds every keyword occurrence (whole words
+    only, so "act" does not fire on "fact" nor "kid" on "kidney") and each
+    occurrence adds its weight to its therapy type.
+    """
+
+    def __init__(self, keywords: Dict[TherapyType, Dict[str, float]] = THERAPY_TYPE_KEYWORDS):
+        self.order = {therapy_type: i for i, therapy_type in enumerate(keywords)}
+        self._exact: Dict[str, List[Tuple[TherapyType, float]]] = {}
+        self._prefixes: List[Tuple[str, TherapyType, float]] = []
+        for therapy_type, table in keywords.items():
+            for keyword, weight in table.items():
+                normalized = " ".join(keyword.lower().rstrip("*").split())
+                if keyword.endswith("*"):
+                    self._prefixes.append((normalized, therapy_type, weight))
+                else:
+                    self._exact.setdefault(normalized, []).append((therapy_type, weight))
+        self._prefixes.sort(key=lambda entry: len(entry[0]), reverse=True)
+        all_keywords = {keyword for table in keywords.values() for keyword in table}
+        alternatives = [f"(?-i:{_keyword_regex(k)})" for k in sorted(all_keywords) if k.rstrip("*").isupper()]
+        alternatives.append(_trie_regex(k for k in all_keywords if not k.rstrip("*").isupper()))
+        # Keywords may not touch other word characters on either side ("act" in "fact"); hyphens
+        # separate words, so "CBT-based" and "panic-attack" still count.
+        self.pattern = re.compile(r"(?<!\w)(?:" + "|".join(alternatives) + r")(?!\w)", re.IGNORECASE)
+
+    def _weights(self, matched: str) -> List[Tuple[TherapyType, float]]:
+        normalized = " ".join(matched.lower().split())
+        weights = list(self._exact.get(normalized, ()))
+        for stem, therapy_type, weight in self._prefixes:
+            if normalized.startswith(stem) and all(t != therapy_type for t, _ in weights):
+                weights.append((therapy_type, weight))
+        return weights
+
+    def scores(self, text: str) -> Dict[TherapyType, float]:
+        scores: Dict[TherapyType, float] = {}
+        for match in self.pattern.finditer(text):
+            for therapy_type, weight in self._weights(match.group()):
+                scores[therapy_type] = scores.get(therapy_type, 0.0) + weight
+        return scores
+
+    def best(self, scores: Dict[TherapyType, float]) -> Optional[TherapyType]:
+        if not scores:
+            return None
+        return max(scores, key=lambda therapy_type: (scores[therapy_type], -self.order[therapy_type]))
+
+therapy_type_classifier = TherapyTypeClassifier()
+
+@dataclass
+class PromptUsage:
+    """Tokens each section of an assembled prompt consumed, and the budgets it was given."""
+    max_prompt_tokens: int = 0
+    instructions: int = 0
+    summary: int = 0
+    context: int = 0
+    context_budget: int = 0
+    context_truncated: bool = False
+    history: int = 0
+    history_budget: int = 0
+    history_messages: int = 0
+    user: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.instructions + self.summary + self.context + self.history + self.user
+
+    def as_dict(self) -> Dict:
+        return {**asdict(self), "total": self.total}
+
 class PromptManager:
     def __init__(self, 
                  default_therapy_type: TherapyType = TherapyType.GENERAL,
-                 conversation_style: ConversationStyle = ConversationStyle.EMPATHETIC):
+                 conversation_style: ConversationStyle = ConversationStyle.EMPATHETIC,
+                 model: str = "gpt-4.1-mini",
+                 max_prompt_tokens: int = 6000,
+                 history_token_budget: int = 3000,
+                 context_token_budget: int = 1200,
+                 summary_token_budget: int = 400):
         self.default_therapy_type = default_therapy_type
         self.conversation_style = conversation_style
+        self.model = model
+        # Ceiling for the whole prompt (system + history + user input).
+        self.max_prompt_tokens = max_prompt_tokens
+        # Upper bound for the history share; shrinks further when the system prompt and pdf_context are large.
+        self.history_token_budget = history_token_budget
+        # Upper bounds for retrieved pdf_context and the session summary; both are cut at sentence boundaries.
+        self.context_token_budget = context_token_budget
+        self.summary_token_budget = summary_token_budget
+
+    def count_message_tokens(self, message: Dict) -> int:
+        return count_tokens(message["content"], self.model) + MESSAGE_TOKEN_OVERHEAD
 
     def detect_therapy_type(self, user_input: str) -> TherapyType:
-        text = user_input.lower()
-        if any(k in text for k in ["cognitive behavioral therapy", "cbt"]):
-            return TherapyType.CBT
-        if any(k in text for k in ["dialectical behavior therapy", "dbt"]):
-            return TherapyType.DBT
-        if any(k in text for k in ["acceptance and commitment therapy", "act"]):
-            return TherapyType.ACT
-        if any(k in text for k in ["grief", "loss", "bereavement"]):
-            return TherapyType.GRIEF
-        if any(k in text for k in ["anxiety", "panic", "worried"]):
-            return TherapyType.ANXIETY
-        if any(k in text for k in ["parent", "child", "kid", "family"]):
-            return TherapyType.PARENTING
-        if any(k in text for k in ["depress", "sad", "hopeless"]):
-            return TherapyType.DEPRESSION
-        if any(k in text for k in ["trauma", "trauma-informed"]):
-            return TherapyType.TRAUMA
+        """Highest-scoring therapy type of the message (see THERAPY_TYPE_KEYWORDS), else the default."""
+        return therapy_type_classifier.best(therapy_type_classifier.scores(user_input)) or self.default_therapy_type
+
+    def classify_document(self, text: str, min_score: float = 10.0, min_share: float = 0.4) -> TherapyType:
+        """
+        Therapy type of a whole document (used to partition the knowledge
+        base): the best-scoring type, provided it reaches min_score and
+        min_share of the combined score of all types.
+        """
+        scores = therapy_type_classifier.scores(text)
+        best = therapy_type_classifier.best(scores)
+        if best is not None and scores[best] >= min_score and scores[best] >= min_share * sum(scores.values()):
+            return best
         return self.default_therapy_type
 
     def generate_system_prompt(self, therapy_type: TherapyType, pdf_context: str = "") -> str:
@@ -62,17 +223,120 @@ class PromptManager:
         """
         return prompt.strip()
 
-    def create_conversation_messages(self, user_input: str, pdf_context: str = "", conversation_history: List[Dict] = None) -> List[Dict]:
-        therapy_type = self.detect_therapy_type(user_input)
-        system_prompt = self.generate_system_prompt(therapy_type, pdf_context)
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        if conversation_history:
-            messages.extend(conversation_history)
-        
-        messages.append({"role": "user", "content": user_input})
-        
+    def truncate_at_sentences(self, text: str, token_budget: int) -> Tuple[str, bool]:
+        """
+        Longest prefix of text that fits token_budget and ends at a sentence
+        boundary, passage by passage (passages are CONTEXT_SEPARATOR-joined).
+        A first sentence that alone exceeds the budget is cut by tokens
+        instead, so the context is never dropped entirely. Returns the text
+        and whether anything was cut.
+        """
+        if not text or count_tokens(text, self.model) <= token_budget:
+            return text, False
+        separator_cost = count_tokens(CONTEXT_SEPARATOR, self.model)
+        kept = []
+        used = 0
+        for passage in text.split(CONTEXT_SEPARATOR):
+            if kept:
+                used += separator_cost
+            sentences = []
+            complete = True
+            for match in _SENTENCE.finditer(passage):
+                cost = count_tokens(match.group(), self.model)
+                if used + cost > token_budget:
+                    if not kept and not sentences:
+                        sentences.append(truncate_tokens(match.group(), token_budget - used, self.model))
+                    complete = False
+                    break
+                sentences.append(match.group())
+                used += cost
+            if sentences:
+                kept.append("".join(sentences).rstrip())
+            if not complete:
+                break
+        return CONTEXT_SEPARATOR.join(kept), True
+
+    def window_history(self, recent_history: Iterable[Dict], token_budget: int) -> List[Dict]:
+        """
+        Fill token_budget from the newest message backwards. recent_history
+        must be ordered newest-first; it is consumed lazily and only as far
+        as the budget reaches. Returns the kept messages oldest-first.
+        """
+        window = []
+        used = 0
+        for message in recent_history:
+            cost = self.count_message_tokens(message)
+            if used + cost > token_budget:
+                break
+            window.append(message)
+            used += cost
+        window.reverse()
+        # Never start the window with an assistant reply whose user turn was cut off.
+        while window and window[0]["role"] == "assistant":
+            window.pop(0)
+        return window
+
+    def create_conversation_messages(self, user_input: str, pdf_context: str = "", conversation_history: List[Dict] = None,
+                                     recent_history: Optional[Iterable[Dict]] = None, session_summary: str = "") -> List[Dict]:
+        messages, _ = self.assemble_conversation(user_input, pdf_context, conversation_history, recent_history, session_summary)
         return messages
 
+    def assemble_conversation(self, user_input: str, pdf_context: str = "", conversation_history: List[Dict] = None,
+                              recent_history: Optional[Iterable[Dict]] = None,
+                              session_summary: str = "") -> Tuple[List[Dict], PromptUsage]:
+        """
+        Build the chat messages for one turn within max_prompt_tokens and
+        report what each section used. Instructions and the user input are
+        always kept; the session summary and pdf_context are cut at sentence
+        boundaries to their budgets, and history fills what is left, up to
+        history_token_budget. History comes either as conversation_history
+        (oldest-first list) or recent_history (newest-first iterable, e.g. a
+        paged DB query). session_summary stands in for the turns it covers.
+        """
+        therapy_type = self.detect_therapy_type(user_input)
+        usage = PromptUsage(max_prompt_tokens=self.max_prompt_tokens)
+        user_turn = {"role": "user", "content": user_input}
+        usage.user = self.count_message_tokens(user_turn)
+        usage.instructions = self.count_message_tokens({"content": self.generate_system_prompt(therapy_type)})
+
+        summary_text = ""
+        if session_summary:
+            summary, _ = self.truncate_at_sentences(session_summary, self.summary_token_budget)
+            summary_text = f"\nSummary of the earlier conversation with this user:\n{summary}"
+            usage.summary = count_tokens(summary_text, self.model)
+        remaining = max(0, self.max_prompt_tokens - usage.instructions - usage.summary - usage.user)
+
+        usage.context_budget = min(self.context_token_budget, remaining)
+        context, usage.context_truncated = self.truncate_at_sentences(pdf_context, usage.context_budget)
+        usage.context = count_tokens(context, self.model)
+        messages = [{"role": "system", "content": self.generate_system_prompt(therapy_type, context) + summary_text}]
+
+        if recent_history is None and conversation_history:
+            recent_history = reversed(conversation_history)
+        if recent_history is not None:
+            usage.history_budget = max(0, min(self.history_token_budget, remaining - usage.context))
+            window = self.window_history(recent_history, usage.history_budget)
+            usage.history = sum(self.count_message_tokens(message) for message in window)
+            usage.history_messages = len(window)
+            messages.extend(window)
+
+        messages.append(user_turn)
+        return messages, usage
+
+    def create_summary_messages(self, previous_summary: str, new_turns: List[Dict]) -> List[Dict]:
+        """Messages asking the model to fold new_turns into previous_summary."""
+        transcript = "\n".join(f"{turn['role'].capitalize()}: {turn['content']}" for turn in new_turns)
+        instructions = (
+            "You maintain a concise running summary of a therapy conversation. "
+            "Update the existing summary with the new exchanges below. Keep the user's main concerns, "
+            "feelings, goals, techniques already suggested and any safety-relevant details. "
+            "Write in third person, at most 200 words, and return only the updated summary."
+        )
+        content = f"Existing summary:\n{previous_summary or '(none yet)'}\n\nNew exchanges:\n{transcript}"
+        return [
+            {"role": "system", "content": instructions},
+            {"role": "user", "content": content},
+        ]
+
     def ensure_response_length(self, response: str) -> str:
         return response
\ No newline at end of file
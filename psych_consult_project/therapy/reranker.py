@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    Re-scores retrieval candidates with a small cross-encoder that reads the
+    query and each chunk together, which ranks far better than comparing two
+    independent embeddings. All candidates go through the model in a single
+    batched forward pass. Scoring costs grow with the candidate count, so
+    rerank() first checks the remaining time budget against a running
+    estimate of the per-candidate cost and declines when it would overrun.
+    """
+
+    # Weight of the newest measurement in the per-candidate cost estimate.
+    COST_SMOOTHING = 0.2
+
+    def __init__(self, model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2", candidates: int = 20,
+                 keep: int = 2, min_score: Optional[float] = None, max_length: int = 256,
+                 budget_seconds: float = 0.15):
+        self.model_name = model_name
+        # Candidates over-fetched from FAISS / BM25 for re-scoring.
+        self.candidates = candidates
+        # Chunks kept after re-ranking, optionally only those scoring at least min_score.
+        self.keep = keep
+        self.min_score = min_score
+        self.max_length = max_length
+        # Time the whole retrieval stage may take, including embedding and search.
+        self.budget_seconds = budget_seconds
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._cost_per_candidate: Optional[float] = None
+        self.counters = Counter()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, max_length=self.max_length, device="cpu")
+        return self._model
+
+    def warm_up(self):
+        """Load the model and measure a first batch, so the first request has a cost estimate."""
+        self.rerank("warm up", ["warm up"] * min(self.candidates, 8), started=None)
+
+    def estimated_seconds(self, candidates: int) -> float:
+        return (self._cost_per_candidate or 0.0) * candidates
+
+    def rerank(self, query: str, texts: Sequence[str], started: Optional[float] = None) -> Optional[List[Tuple[int, float]]]:
+        """
+        (index into texts, score) pairs, best first, limited to `keep`; None
+        when re-ranking was skipped because it would not fit in what is left
+        of the budget since `started` (a time.perf_counter() value).
+        """
+        if not texts:
+            return []
+        if started is not None:
+            remaining = self.budget_seconds - (time.perf_counter() - started)
+            if remaining <= 0 or self.estimated_seconds(len(texts)) > remaining:
+                self.counters["skipped_over_budget"] += 1
+                return None
+
+        scoring_started = time.perf_counter()
+        try:
+            scores = self.model.predict([(query, text) for text in texts], batch_size=len(texts),
+                                        show_progress_bar=False)
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.error(f"Error re-ranking retrieval candidates: {e}")
+            return None
+        cost = (time.perf_counter() - scoring_started) / len(texts)
+        if self._cost_per_candidate is None:
+            self._cost_per_candidate = cost
+        else:
+            self._cost_per_candidate += self.COST_SMOOTHING * (cost - self._cost_per_candidate)
+        self.counters["reranked"] += 1
+
+        ranked = sorted(enumerate(float(score) for score in scores), key=lambda item: item[1], reverse=True)
+        if self.min_score is not None:
+            ranked = [(i, score) for i, score in ranked if score >= self.min_score]
+        return ranked[:self.keep]
+
+    def get_stats(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "candidates": self.candidates,
+            "keep": self.keep,
+            "budget_ms": self.budget_seconds * 1000,
+            "estimated_ms": self.estimated_seconds(self.candidates) * 1000,
+            "reranked": self.counters["reranked"],
+            "skipped_over_budget": self.counters["skipped_over_budget"],
+            "errors": self.counters["errors"],
+        }
@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+import redis
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalCache:
+    """
+    Two-level cache in front of PDFVectorStore retrieval: a per-process LRU
+    backed by a shared Redis tier. It stores normalized query -> embedding
+    vector and (query, index version, top_k) -> chunk ids. Result keys carry
+    the index version, so rebuilding the vector store invalidates them
+    without an explicit flush. Redis is optional; if it is unreachable the
+    cache keeps working with the local tier only.
+    """
+
+    # Seconds to stop talking to Redis after a connection error.
+    REDIS_BACKOFF_SECONDS = 30
+
+    def __init__(self, namespace: str, redis_url: Optional[str] = None, local_size: int = 1024,
+                 embedding_ttl: int = 7 * 24 * 3600, result_ttl: int = 24 * 3600):
+        self.namespace = namespace
+        self.embedding_ttl = embedding_ttl
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._embeddings = LRUCache(maxsize=local_size)
+        self._results = LRUCache(maxsize=local_size)
+        self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.05, socket_connect_timeout=0.05) if redis_url else None
+        self._redis_disabled_until = 0.0
+        self.counters = Counter()
+        self.embed_seconds_total = 0.0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(query.lower().split()).strip(" .!?")
+
+    def _key(self, kind: str, *parts) -> str:
+        digest = hashlib.sha1(parts[-1].encode("utf-8")).hexdigest()
+        return ":".join([self.namespace, kind, *map(str, parts[:-1]), digest])
+
+    def _redis_call(self, method: str, *args):
+        if self._redis is None or time.monotonic() < self._redis_disabled_until:
+            return None
+        try:
+            return getattr(self._redis, method)(*args)
+        except redis.RedisError as e:
+            self.counters["redis_errors"] += 1
+            self._redis_disabled_until = time.monotonic() + self.REDIS_BACKOFF_SECONDS
+            logger.warning(f"Retrieval cache Redis tier unavailable, using local tier only: {e}")
+            return None
+
+    def _get(self, kind: str, local: LRUCache, key: str, decode):
+        with self._lock:
+            value = local.get(key)
+        if value is not None:
+            self.counters[f"{kind}_local_hits"] += 1
+            return value
+        raw = self._redis_call("get", key)
+        if raw is not None:
+            value = decode(raw)
+            with self._lock:
+                local[key] = value
+            self.counters[f"{kind}_redis_hits"] += 1
+            return value
+        self.counters[f"{kind}_misses"] += 1
+        return None
+
+    def _set(self, local: LRUCache, key: str, value, encoded: bytes, ttl: int):
+        with self._lock:
+            local[key] = value
+        self._redis_call("set", key, encoded, ttl)
+
+    def get_embedding(self, normalized_query: str) -> Optional[List[float]]:
+        key = self._key("emb", normalized_query)
+        return self._get("embedding", self._embeddings, key, lambda raw: np.frombuffer(raw, dtype=np.float32).tolist())
+
+    def set_embedding(self, normalized_query: str, embedding: List[float], embed_seconds: float = 0.0):
+        self.embed_seconds_total += embed_seconds
+        self.counters["embeddings_computed"] += 1
+        key = self._key("emb", normalized_query)
+        self._set(self._embeddings, key, embedding, np.asarray(embedding, dtype=np.float32).tobytes(), self.embedding_ttl)
+
+    def get_results(self, normalized_query: str, index_version: str, top_k: int) -> Optional[List[str]]:
+        key = self._key("res", index_version, top_k, normalized_query)
+        return self._get("result", self._results, key, lambda raw: raw.decode("utf-8").split("\n") if raw else [])
+
+    def set_results(self, normalized_query: str, index_version: str, top_k: int, chunk_ids: List[str]):
+        key = self._key("res", index_version, top_k, normalized_query)
+        self._set(self._results, key, chunk_ids, "\n".join(chunk_ids).encode("utf-8"), self.result_ttl)
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.counters)
+        for kind in ("embedding", "result"):
+            hits = self.counters[f"{kind}_local_hits"] + self.counters[f"{kind}_redis_hits"]
+            lookups = hits + self.counters[f"{kind}_misses"]
+            stats[f"{kind}_hit_rate"] = hits / lookups if lookups else 0.0
+        # Every embedding hit skips one MiniLM forward pass; estimate the CPU time that saved.
+        computed = self.counters["embeddings_computed"]
+        avg_embed_seconds = self.embed_seconds_total / computed if computed else 0.0
+        embedding_hits = self.counters["embedding_local_hits"] + self.counters["embedding_redis_hits"]
+        result_hits = self.counters["result_local_hits"] + self.counters["result_redis_hits"]
+        stats["avg_embed_seconds"] = avg_embed_seconds
+        stats["estimated_embed_seconds_saved"] = avg_embed_seconds * (embedding_hits + result_hits)
+        return stats
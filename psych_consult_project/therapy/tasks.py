@@ -1,5 +1,9 @@
 from celery import shared_task
+from django.conf import settings
 from django.core.management import call_command
+from django.utils import timezone
+from .models import TherapyChatMessage, TherapySession
+from .prompt import PromptManager
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,3 +16,100 @@ def delete_old_therapy_sessions_task():
         logger.info("delete_old_therapy_sessions_task completed successfully.")
     except Exception as e:
         logger.error(f"Error in delete_old_therapy_sessions_task: {e}")
+
+@shared_task
+def build_knowledge_base_task(full=False):
+    logger.info("Running build_knowledge_base_task...")
+    try:
+        call_command('build_knowledge_base', full=full)
+        logger.info("build_knowledge_base_task completed successfully.")
+    except Exception as e:
+        logger.error(f"Error in build_knowledge_base_task: {e}")
+
+@shared_task
+def summarize_therapy_session_task(session_id):
+    """
+    Fold the messages added since the last run into TherapySession.summary.
+    Only the new turns are sent to the model, so the cost of a refresh does
+    not grow with the length of the session. The newest
+    THERAPY_SUMMARY_KEEP_RECENT_MESSAGES stay out of the summary, and
+    summary_last_message_id stays behind them, so the prompt keeps them as
+    verbatim history.
+    """
+    try:
+        session = TherapySession.objects.get(id=session_id)
+    except TherapySession.DoesNotExist:
+        logger.warning(f"Therapy session {session_id} not found. Skipping summary.")
+        return
+
+    previous_last_id = session.summary_last_message_id
+    new_messages = list(
+        TherapyChatMessage.objects.filter(session=session, id__gt=previous_last_id or 0).order_by('id')
+    )
+    new_messages = new_messages[:max(len(new_messages) - settings.THERAPY_SUMMARY_KEEP_RECENT_MESSAGES, 0)]
+    if not new_messages:
+        return
+
+    new_turns = []
+    for chat_message in new_messages:
+        new_turns.append({"role": "user", "content": chat_message.user_message})
+        new_turns.append({"role": "assistant", "content": chat_message.ai_response})
+
+    # Imported here: knowledge_base imports this module.
+    from .knowledge_base import get_llm_client
+
+    try:
+        response = get_llm_client().complete(
+            PromptManager().create_summary_messages(session.summary, new_turns),
+            max_tokens=400
+        )
+        summary = response.choices[0].message.content.strip()
+    except Exception as e:
+        logger.error(f"Error summarizing therapy session {session_id}: {e}", exc_info=True)
+        return
+
+    # Only apply the result if no concurrent run moved the summary forward and the session was not
+    # cleared meanwhile. update() also leaves updated_at alone, so session ordering is unaffected.
+    updated = TherapySession.objects.filter(
+        id=session.id, summary_last_message_id=previous_last_id, summary_generation=session.summary_generation
+    ).update(
+        summary=summary,
+        summary_last_message_id=new_messages[-1].id,
+        summary_updated_at=timezone.now()
+    )
+    if updated:
+        logger.info(f"Summarized {len(new_messages)} new messages for therapy session {session_id}.")
+
+@shared_task(track_started=True)
+def chat_turn_task(session_id, user_message):
+    """
+    A chat turn queued by ChatView in job mode: retrieval, the LLM call and
+    persistence run on a worker instead of tying up a web worker. The
+    returned dict is the job result served by ChatJobView; user_id lets it
+    check that the job belongs to the requesting user.
+    """
+    # Imported here: both modules import this one.
+    from .chat_turn import TurnTimings, build_chat_messages, chat_prompt_manager, save_chat_turn
+    from .knowledge_base import get_knowledge_base
+
+    try:
+        session = TherapySession.objects.get(id=session_id)
+    except TherapySession.DoesNotExist:
+        logger.warning(f"Therapy session {session_id} not found. Skipping chat turn.")
+        return {"success": False, "error": "Session not found", "session_id": session_id}
+
+    result = {"session_id": str(session.id), "user_id": str(session.user_id)}
+    timings = TurnTimings()
+    try:
+        knowledge_base = get_knowledge_base()
+        messages = build_chat_messages(chat_prompt_manager(), knowledge_base.pdf_store, session, user_message, timings)
+        with timings.stage("llm"):
+            response = knowledge_base.llm.complete(messages, max_tokens=300)
+        ai_response_text = response.choices[0].message.content
+        with timings.stage("save"):
+            save_chat_turn(session, user_message, ai_response_text)
+        logger.info(f"Chat turn timings for session {session_id}: {timings.as_dict()}")
+    except Exception as e:
+        logger.error(f"Error in chat_turn_task for therapy session {session_id}: {e}")
+        return {**result, "success": False, "error": str(e)}
+    return {**result, "success": True, "response": {"text": ai_response_text}}
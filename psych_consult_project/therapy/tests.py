@@ -1,3 +1,43 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from .prompt import PromptManager, TherapyType, therapy_type_classifier
+
+
+class DetectTherapyTypeTests(SimpleTestCase):
+    def setUp(self):
+        self.prompt_manager = PromptManager()
+
+    def test_keywords_match_whole_words_only(self):
+        self.assertEqual(self.prompt_manager.detect_therapy_type("That's a fact"), TherapyType.GENERAL)
+        self.assertEqual(self.prompt_manager.detect_therapy_type("My kidney results came back"), TherapyType.GENERAL)
+        self.assertEqual(self.prompt_manager.detect_therapy_type("The actor was great"), TherapyType.GENERAL)
+        self.assertEqual(self.prompt_manager.detect_therapy_type("My kid won't sleep"), TherapyType.PARENTING)
+
+    def test_hyphenated_words_match(self):
+        self.assertEqual(self.prompt_manager.detect_therapy_type("Is CBT-based coaching any good?"), TherapyType.CBT)
+        self.assertEqual(self.prompt_manager.detect_therapy_type("A DBT-informed group"), TherapyType.DBT)
+        self.assertEqual(self.prompt_manager.detect_therapy_type("Another panic-attack today"), TherapyType.ANXIETY)
+        self.assertEqual(self.prompt_manager.detect_therapy_type("PTSD-related nightmares"), TherapyType.TRAUMA)
+        self.assertEqual(self.prompt_manager.detect_therapy_type("Staying non-anxious"), TherapyType.ANXIETY)
+        self.assertEqual(self.prompt_manager.detect_therapy_type("A trauma-informed approach"), TherapyType.TRAUMA)
+
+    def test_acronyms_written_in_capitals_are_case_sensitive(self):
+        self.assertEqual(self.prompt_manager.detect_therapy_type("I need to act now"), TherapyType.GENERAL)
+        self.assertEqual(self.prompt_manager.detect_therapy_type("Can ACT help me?"), TherapyType.ACT)
+
+    def test_prefix_keywords_and_phrases(self):
+        self.assertEqual(self.prompt_manager.detect_therapy_type("I've been so depressed"), TherapyType.DEPRESSION)
+        self.assertEqual(
+            self.prompt_manager.detect_therapy_type("Is Cognitive  Behavioral\nTherapy right for me?"), TherapyType.CBT
+        )
+        self.assertEqual(self.prompt_manager.detect_therapy_type("How do I use the TIPP skill?"), TherapyType.DBT)
+
+    def test_highest_score_wins_and_order_breaks_ties(self):
+        scores = therapy_type_classifier.scores("I'm anxious and worried, and a bit sad")
+        self.assertEqual(scores[TherapyType.ANXIETY], 3.0)
+        self.assertEqual(scores[TherapyType.DEPRESSION], 1.0)
+        self.assertEqual(self.prompt_manager.detect_therapy_type("grief and panic"), TherapyType.GRIEF)
+
+    def test_no_keywords_returns_default(self):
+        prompt_manager = PromptManager(default_therapy_type=TherapyType.CBT)
+        self.assertEqual(prompt_manager.detect_therapy_type("Hello there"), TherapyType.CBT)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ChatView, TherapySessionViewSet
+from .views import AsyncChatView, ChatJobView, ChatView, KnowledgeBaseStatusView, TherapySessionViewSet
 
 app_name = 'therapy'
 
@@ -9,5 +9,8 @@ router.register(r'sessions', TherapySessionViewSet, basename='therapy-session')
 
 urlpatterns = [
     path('chat/', ChatView.as_view(), name='chat'),
+    path('chat/async/', AsyncChatView.as_view(), name='chat-async'),
+    path('chat/jobs/<str:job_id>/', ChatJobView.as_view(), name='chat-job'),
+    path('knowledge-base/', KnowledgeBaseStatusView.as_view(), name='knowledge-base-status'),
     path('', include(router.urls)),
 ]
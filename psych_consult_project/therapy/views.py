@@ -1,39 +1,59 @@
-from django.conf import settings
+from asgiref.sync import sync_to_async
+from celery.result import AsyncResult
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from rest_framework import generics, status, viewsets
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from .prompt import PromptManager, TherapyType, ConversationStyle
-from .pdf_processor import PDFVectorStore
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .chat_turn import TurnTimings, build_chat_messages, chat_prompt_manager, retrieval_therapy_type, save_chat_turn
+from .knowledge_base import get_knowledge_base
+from .llm_client import CircuitOpenError
+from .history import aload_recent_history, schedule_summary_if_due
 from .models import TherapyChatMessage, TherapySession
-from .serializers import TherapyChatMessageSerializer, TherapySessionSerializer, TherapySessionListSerializer
-from openai import OpenAI
+from .pagination import MessageCursorPagination
+from .serializers import TherapyChatMessageSerializer, TherapySessionListSerializer
+from .tasks import chat_turn_task
+import asyncio
+import json
 import logging
-import os
 
 logger = logging.getLogger(__name__)
 
+class EventStreamRenderer(BaseRenderer):
+    """Lets DRF content negotiation accept `Accept: text/event-stream` for ChatView."""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode(self.charset)
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 class ChatView(APIView):
     permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        self.pdf_store = PDFVectorStore(folder_path=settings.PDF_FOLDER_PATH, vector_store_path=os.path.join(settings.BASE_DIR, 'vector_store'))
-        self.prompt_manager = PromptManager(
-            default_therapy_type=TherapyType.GENERAL,
-            conversation_style=ConversationStyle.EMPATHETIC
-        )
-        self._initialize_knowledge_base()
-
-    def _initialize_knowledge_base(self):
-        try:
-            if not self.pdf_store.load_vector_store(allow_dangerous_deserialization=True):
-                logger.info("Building vector store from PDFs...")
-                self.pdf_store.build_vector_store()
-        except Exception as e:
-            logger.error(f"Error initializing knowledge base: {e}")
+        # The client, embedder and FAISS index are loaded once per process and shared.
+        knowledge_base = get_knowledge_base()
+        self.llm = knowledge_base.llm
+        self.pdf_store = knowledge_base.pdf_store
+        self.intent_router = knowledge_base.intent_router
+        self.prompt_manager = chat_prompt_manager()
 
     def post(self, request, *args, **kwargs):
         user_message = request.data.get("message", "")
@@ -52,59 +72,274 @@ class ChatView(APIView):
             # Create a new session if no session_id is provided
             session = TherapySession.objects.create(user=request.user, title=None) # Start with no title
 
-        # Retrieve conversation history for this specific session
-        conversation_history_db = TherapyChatMessage.objects.filter(session=session).order_by('timestamp')
-        conversation_history = []
-        for chat_message in conversation_history_db:
-            conversation_history.append({"role": "user", "content": chat_message.user_message})
-            conversation_history.append({"role": "assistant", "content": chat_message.ai_response})
-
-        pdf_context = ""
-        if self.pdf_store and self.pdf_store.vector_store:
-            pdf_context = self.pdf_store.retrieve_pdf_context(user_message)
-
-        messages = self.prompt_manager.create_conversation_messages(
-            user_input=user_message,
-            pdf_context=pdf_context,
-            conversation_history=conversation_history
-        )
+        # Job mode first: its clients expect the 202 job shape for every turn, canned replies included.
+        if self._wants_job(request):
+            return self._enqueue_turn(session, user_message)
+
+        intent = self._match_intent(user_message)
+        if intent:
+            return self._intent_response(request, session, user_message, intent)
+
+        timings = TurnTimings()
+        messages = build_chat_messages(self.prompt_manager, self.pdf_store, session, user_message, timings)
+
+        if self._wants_stream(request):
+            return self._stream_response(session, user_message, messages, timings)
 
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=messages,
-                max_tokens=300
-            )
+            with timings.stage("llm"):
+                response = self.llm.complete(messages, max_tokens=300)
             ai_response_text = response.choices[0].message.content
+            with timings.stage("save"):
+                save_chat_turn(session, user_message, ai_response_text)
+            logger.info(f"Chat turn timings for session {session.id}: {timings.as_dict()}")
 
-            # Save message to database, linked to the session
-            TherapyChatMessage.objects.create(
-                session=session,
-                user_message=user_message,
-                ai_response=ai_response_text
-            )
-            
-            # If this is the first message in a new session, set the title
-            if not session.title:
-                # Use the first 50 characters of the user's message as the title
-                session.title = user_message[:50] + ('...' if len(user_message) > 50 else '')
-            
-            # Update session's updated_at timestamp
-            session.save()
-
-            return Response({"success": True, "response": {"text": ai_response_text}, "session_id": str(session.id)})
+            return Response({"success": True, "response": {"text": ai_response_text}, "session_id": str(session.id)},
+                            headers={"Server-Timing": timings.server_timing()})
+        except CircuitOpenError as e:
+            return Response({"success": False, "error": str(e)}, status=503)
         except Exception as e:
             logger.error(f"Error during OpenAI API call: {e}")
             return Response({"success": False, "error": str(e)}, status=500)
 
+    def _match_intent(self, user_message):
+        if not self.intent_router:
+            return None
+        try:
+            return self.intent_router.route(user_message)
+        except Exception as e:
+            logger.error(f"Error matching chat intent: {e}")
+            return None
+
+    def _intent_response(self, request, session, user_message, intent):
+        """Answer small talk with the intent's canned reply, skipping retrieval and the LLM."""
+        save_chat_turn(session, user_message, intent.reply)
+        payload = {"success": True, "response": {"text": intent.reply}, "session_id": str(session.id), "intent": intent.name}
+        if not self._wants_stream(request):
+            return Response(payload)
+        events = [
+            _sse_event("session", {"session_id": str(session.id)}),
+            _sse_event("token", {"text": intent.reply}),
+            _sse_event("done", payload),
+        ]
+        response = StreamingHttpResponse(iter(events), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        return response
+
+    def _wants_stream(self, request):
+        if request.query_params.get("stream", "").lower() in ("1", "true", "yes"):
+            return True
+        return "text/event-stream" in request.headers.get("Accept", "")
+
+    def _wants_job(self, request):
+        if request.query_params.get("job", "").lower() in ("1", "true", "yes"):
+            return True
+        return "respond-async" in request.headers.get("Prefer", "")
+
+    def _enqueue_turn(self, session, user_message):
+        """
+        Job mode: queue retrieval, the LLM call and persistence as a Celery
+        task and answer 202 with the job id right away; the result is read
+        from ChatJobView. Small talk answered by an intent never gets here.
+        """
+        try:
+            job = chat_turn_task.delay(str(session.id), user_message)
+        except Exception as e:
+            logger.error(f"Error queueing chat turn: {e}")
+            return Response({"success": False, "error": "Could not queue the message, please try again."}, status=503)
+        return Response({
+            "success": True,
+            "job_id": job.id,
+            "session_id": str(session.id),
+            "status_url": reverse('therapy:chat-job', args=[job.id]),
+        }, status=202)
+
+    def _stream_response(self, session, user_message, messages, timings):
+        """
+        Forward completion tokens as Server-Sent Events. Whatever text was
+        generated is persisted when the stream finishes, fails or the client
+        disconnects (the WSGI server closes the generator).
+        """
+        def event_stream():
+            chunks = []
+            try:
+                yield _sse_event("session", {"session_id": str(session.id)})
+                with timings.stage("llm"):
+                    for token in self.llm.stream(messages, max_tokens=300):
+                        chunks.append(token)
+                        yield _sse_event("token", {"text": token})
+                yield _sse_event("done", {"success": True, "response": {"text": "".join(chunks)}, "session_id": str(session.id)})
+            except Exception as e:
+                logger.error(f"Error during OpenAI streaming call: {e}")
+                yield _sse_event("error", {"success": False, "error": str(e)})
+            finally:
+                if chunks:
+                    try:
+                        save_chat_turn(session, user_message, "".join(chunks))
+                    except Exception as e:
+                        logger.error(f"Error saving streamed chat message: {e}")
+                logger.info(f"Chat turn timings for session {session.id}: {timings.as_dict()}")
+
+        response = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["Server-Timing"] = timings.server_timing()  # Stages before the LLM call
+        response["X-Accel-Buffering"] = "no"  # Disable proxy buffering so tokens flush immediately
+        return response
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChatView(View):
+    """
+    Async variant of ChatView for ASGI deployments (uvicorn/daphne with
+    psych_consult_project.asgi). The OpenAI round trip and ORM calls are
+    awaited, and the CPU-bound FAISS search runs in a worker thread, so a
+    single process can keep many chats in flight at once.
+    """
+    http_method_names = ['post']
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.prompt_manager = chat_prompt_manager()
+
+    async def post(self, request, *args, **kwargs):
+        user = await self._authenticate(request)
+        if user is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body"}, status=400)
+        user_message = data.get("message", "")
+        session_id = data.get("session_id", None)
+
+        if not user_message:
+            return JsonResponse({"error": "Message cannot be empty"}, status=400)
+
+        knowledge_base = await sync_to_async(get_knowledge_base)()
+
+        if session_id:
+            try:
+                session = await TherapySession.objects.aget(id=session_id, user=user)
+            except (TherapySession.DoesNotExist, ValidationError):
+                return JsonResponse({"error": "Session not found or does not belong to user"}, status=404)
+        else:
+            session = await TherapySession.objects.acreate(user=user, title=None)
+
+        if knowledge_base.intent_router:
+            try:
+                # Reading the intent table needs the ORM; matching is pure CPU and runs off the event loop.
+                await sync_to_async(knowledge_base.intent_router.refresh_if_stale)()
+                intent = await sync_to_async(knowledge_base.intent_router.match, thread_sensitive=False)(user_message)
+            except Exception as e:
+                logger.error(f"Error matching chat intent: {e}")
+                intent = None
+            if intent:
+                await self._save_turn(session, user_message, intent.reply)
+                return JsonResponse({"success": True, "response": {"text": intent.reply},
+                                     "session_id": str(session.id), "intent": intent.name})
+
+        timings = TurnTimings()
+
+        async def load_history():
+            with timings.stage("history"):
+                return await aload_recent_history(
+                    session, self.prompt_manager.history_token_budget, self.prompt_manager.count_message_tokens
+                )
+
+        async def retrieve():
+            if not knowledge_base.vector_store_ready:
+                return ""
+            with timings.stage("retrieval"):
+                try:
+                    # FAISS releases the GIL, so searches from concurrent requests can overlap.
+                    return await sync_to_async(knowledge_base.pdf_store.retrieve_pdf_context, thread_sensitive=False)(
+                        user_message, therapy_type=retrieval_therapy_type(self.prompt_manager, user_message)
+                    )
+                except Exception as e:
+                    # The turn is answered without PDF context rather than dropped.
+                    logger.error(f"Error retrieving PDF context: {e}", exc_info=True)
+                    return ""
+
+        with timings.stage("pre_llm"):
+            # Neither depends on the other; the turn waits only for the slower one.
+            recent_history, pdf_context = await asyncio.gather(load_history(), retrieve())
+            with timings.stage("prompt"):
+                messages, usage = self.prompt_manager.assemble_conversation(
+                    user_input=user_message,
+                    pdf_context=pdf_context,
+                    recent_history=recent_history,
+                    session_summary=session.summary
+                )
+        logger.info(f"Prompt tokens for session {session.id}: {usage.as_dict()}")
+
+        try:
+            with timings.stage("llm"):
+                response = await knowledge_base.llm.acomplete(messages, max_tokens=300)
+            ai_response_text = response.choices[0].message.content
+            with timings.stage("save"):
+                await self._save_turn(session, user_message, ai_response_text)
+            logger.info(f"Chat turn timings for session {session.id}: {timings.as_dict()}")
+
+            return JsonResponse({"success": True, "response": {"text": ai_response_text}, "session_id": str(session.id)},
+                                headers={"Server-Timing": timings.server_timing()})
+        except CircuitOpenError as e:
+            return JsonResponse({"success": False, "error": str(e)}, status=503)
+        except Exception as e:
+            logger.error(f"Error during async OpenAI API call: {e}")
+            return JsonResponse({"success": False, "error": str(e)}, status=500)
+
+    async def _save_turn(self, session, user_message, ai_response_text):
+        await TherapyChatMessage.objects.acreate(
+            session=session,
+            user_message=user_message,
+            ai_response=ai_response_text
+        )
+        if not session.title:
+            session.title = user_message[:50] + ('...' if len(user_message) > 50 else '')
+        await session.asave(update_fields=['title', 'updated_at'])
+        try:
+            await sync_to_async(schedule_summary_if_due)(session)
+        except Exception as e:
+            logger.error(f"Error scheduling session summary: {e}")
+
+    async def _authenticate(self, request):
+        try:
+            result = await sync_to_async(JWTAuthentication().authenticate)(request)
+        except AuthenticationFailed:
+            return None
+        return result[0] if result else None
+
+class ChatJobView(APIView):
+    """
+    Result of a chat turn queued in job mode: pending, running, done (with
+    the response) or failed. Answers immediately; clients poll until the job
+    is done or failed, so no web worker is held while the turn runs.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = AsyncResult(job_id)
+        if not job.ready():
+            # Celery reports unknown ids as pending too; neither reveals anything about the job.
+            return Response({"job_id": job_id, "status": "running" if job.state == "STARTED" else "pending"})
+        if not job.successful():
+            return Response({"job_id": job_id, "status": "failed"})
+
+        result = dict(job.result or {})
+        if result.pop("user_id", None) != str(request.user.pk):
+            return Response({"error": "Job not found"}, status=404)
+        return Response({"job_id": job_id, "status": "done" if result.get("success") else "failed", **result})
+
+class KnowledgeBaseStatusView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_knowledge_base().get_stats())
+
 class TherapySessionViewSet(viewsets.ModelViewSet):
     queryset = TherapySession.objects.all()
-    serializer_class = TherapySessionSerializer
-
-    def get_serializer_class(self):
-        if self.action == 'list':
-            return TherapySessionListSerializer
-        return TherapySessionSerializer
+    # Session metadata only; messages are paged through the messages action.
+    serializer_class = TherapySessionListSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -115,19 +350,29 @@ class TherapySessionViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
+        """Newest messages first, `limit` per page; older pages via `?before=<cursor>`."""
         try:
             session = self.get_queryset().get(pk=pk)
-            messages = session.messages.all()
-            serializer = TherapyChatMessageSerializer(messages, many=True)
-            return Response(serializer.data)
         except TherapySession.DoesNotExist:
             return Response({"error": "Session not found"}, status=status.HTTP_404_NOT_FOUND)
+        paginator = MessageCursorPagination()
+        page = paginator.paginate_queryset(session.messages.all(), request, view=self)
+        serializer = TherapyChatMessageSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post'])
     def clear_messages(self, request, pk=None):
         try:
             session = self.get_queryset().get(pk=pk)
-            session.messages.all().delete()
+            with transaction.atomic():
+                session.messages.all().delete()
+                # The summary describes the deleted messages; it must not reach the model again.
+                session.summary = ''
+                session.summary_last_message_id = None
+                session.summary_updated_at = None
+                session.summary_generation = F('summary_generation') + 1
+                session.save(update_fields=['summary', 'summary_last_message_id', 'summary_updated_at',
+                                            'summary_generation'])
             return Response({"success": True, "message": "Session messages cleared."},
                             status=status.HTTP_200_OK)
         except TherapySession.DoesNotExist: